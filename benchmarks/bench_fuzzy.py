@@ -0,0 +1,50 @@
+"""
+Compares `FuzzyMatcher` against the previous `_get_closest_string`, which scored and sorted every candidate for every query.
+Run with `python benchmarks/bench_fuzzy.py [sizes...]`.
+"""
+import os
+import sys
+import random
+from time import perf_counter
+from Levenshtein import distance
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lemon import FuzzyMatcher
+
+WORDS = ['Tesla', 'Apple', 'Micro', 'Soft', 'Deutsche', 'Bank', 'Siemens', 'Energy', 'Health', 'Care', 'Global', 'Tech',
+         'Holding', 'Group', 'Capital', 'Motors', 'Pharma', 'Systems', 'Networks', 'Foods', 'Airlines', 'Mining']
+SUFFIXES = ['Inc', 'AG', 'SE', 'plc', 'Corp', 'Ltd', 'N.V.', 'S.A.']
+
+def naive_closest(string, iterable, length_dependant=True, preprocess=lambda s: s.lower()):
+    string = preprocess(string)
+    iterable = list(filter(lambda x: x != None, iterable))
+    distances = sorted({s : distance(string, preprocess(s)) / (max(len(preprocess(s)),0.01) if length_dependant else 1) for s in iterable}.items(), key=lambda i: i[1])
+    if len(distances) > 0: return distances[0][0]
+    return string
+
+def make_names(count, rng):
+    return ['{0} {1} {2} {3}'.format(rng.choice(WORDS), rng.choice(WORDS), rng.choice(SUFFIXES), i) for i in range(count)]
+
+def timed(function, repeat):
+    start = perf_counter()
+    for _ in range(repeat): result = function()
+    return (perf_counter() - start) / repeat, result
+
+def main(sizes):
+    rng = random.Random(42)
+    print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>14} {5:>9}'.format('names', 'naive', 'prepare', 'top-1', 'batch of 100', 'speedup'))
+    for size in sizes:
+        names = make_names(size, rng)
+        queries = [rng.choice(names)[:-2] + rng.choice('xyz') for _ in range(100)]
+
+        naive, expected = timed(lambda: naive_closest(queries[0], names), 1)
+        prepare, matcher = timed(lambda: FuzzyMatcher(names), 1)
+        top, found = timed(lambda: matcher.top(queries[0]), 5)
+        batch, _ = timed(lambda: matcher.match_many(queries), 1)
+        assert found[0][0] == expected, 'FuzzyMatcher disagrees with the naive search'
+
+        print('{0:>8} {1:>10.2f}ms {2:>10.2f}ms {3:>10.2f}ms {4:>12.2f}ms {5:>8.1f}x'.format(
+            size, naive * 1e3, prepare * 1e3, top * 1e3, batch * 1e3, naive / top))
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10000, 30000, 100000])
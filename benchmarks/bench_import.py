@@ -0,0 +1,82 @@
+"""
+Measures the cold start cost of `lemon`, every run in a fresh interpreter, as short-lived processes pay it on every start. \n
+Run with `python benchmarks/bench_import.py`. `import, eager dependencies` also imports the dependencies `lemon` only loads
+once they are needed, which is what importing it cost before they were deferred. `is_market_open, holidays per call` times
+the first market hours lookup as `lemon` did it before `TradingCalendar`, a single `holidays` lookup, as the baseline for the
+`is_market_open` scenarios: without, and with, a saved calendar. Pass `--modules 10` to list the slowest modules imported by
+`import lemon`, as reported by `python -X importtime`, and `--save`, `--compare` and `--tolerance` as to `bench_lemon.py`.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SCENARIOS = {
+    'import': 'import lemon',
+    'import, eager dependencies': 'import lemon, Levenshtein, holidays, pytz',
+    'is_market_open, holidays per call': ('import lemon; from datetime import datetime; from pytz import timezone; from holidays import Germany; '
+                                          "now = datetime.now(timezone('Europe/Berlin')); now.date() in Germany(prov='NW', years=now.year)"),
+    'is_market_open': 'import lemon; lemon.Lemon.is_market_open()',
+    'is_market_open, saved calendar': 'import lemon; lemon.Lemon.is_market_open()',
+}
+
+def measure(code, env):
+    timed = 'from time import perf_counter; started = perf_counter(); {0}; print(perf_counter() - started)'.format(code)
+    output = subprocess.run([sys.executable, '-c', timed], cwd=ROOT, env=env, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return float(output.split()[-1])
+
+def get_slowest_modules(env, count):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import lemon'], cwd=ROOT, env=env,
+                            stderr=subprocess.PIPE, check=True, universal_newlines=True).stderr
+    modules = list()
+    for line in stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit(): continue
+        modules.append((int(fields[1]), fields[2].strip()))
+    return sorted(modules, reverse=True)[:count]
+
+def run(runs):
+    env = dict(os.environ, LEMON_TRADING_CALENDAR='') # computed anew every run, and the user's saved calendar left alone
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        saved = dict(env, LEMON_TRADING_CALENDAR=os.path.join(directory, 'calendar.json'))
+        subprocess.run([sys.executable, '-c', 'import lemon; lemon.TradingCalendar().save()'], cwd=ROOT, env=saved, check=True)
+        for scenario, code in SCENARIOS.items():
+            results[scenario] = median(measure(code, saved if scenario.endswith('saved calendar') else env) for _ in range(runs))
+    return env, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters to take the median of, per scenario')
+    parser.add_argument('--modules', type=int, default=0, help='how many of the slowest modules to list')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='a JSON file saved earlier to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='how much slower than the saved results is still fine')
+    args = parser.parse_args()
+
+    env, results = run(args.runs)
+    print('{0:<36} {1:>10}'.format('scenario', 'ms'))
+    for scenario, seconds in results.items():
+        print('{0:<36} {1:>10.1f}'.format(scenario, seconds * 1000))
+
+    if args.modules:
+        print('\n{0:<36} {1:>10}'.format('module', 'ms'))
+        for microseconds, module in get_slowest_modules(env, args.modules):
+            print('{0:<36} {1:>10.1f}'.format(module, microseconds / 1000))
+
+    if args.save:
+        with open(args.save, 'w') as f: json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+        regressions = ['{0}: {1:.1f}ms, was {2:.1f}ms'.format(scenario, seconds * 1000, baseline[scenario] * 1000)
+                       for scenario, seconds in results.items() if scenario in baseline and seconds > baseline[scenario] * (1 + args.tolerance)]
+        for regression in regressions: print('REGRESSION', regression)
+        if regressions: sys.exit(1)
+
+if __name__ == '__main__':
+    main()
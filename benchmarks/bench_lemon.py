@@ -0,0 +1,103 @@
+"""
+Measures request counts, wall time and peak memory of `lemon`'s main operations against a local `StubServer`,
+for growing portfolios, order histories and instrument catalogs. \n
+Run with `python benchmarks/bench_lemon.py`. Pass `--save results.json` to keep the results, and
+`--compare results.json` to exit with `1` if an operation now needs more requests, or is slower by more than `--tolerance`
+and by more than `--slack` seconds, which keeps fast operations from failing on noise.
+"""
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lemon import Lemon, Transport, InstrumentCache, InstrumentCatalog, QuoteCache, Trace
+from stub_server import StubServer
+
+SIZES = {
+    'small': {'positions': 10, 'orders': 100, 'instruments': 1000},
+    'medium': {'positions': 50, 'orders': 1000, 'instruments': 10000},
+    'large': {'positions': 200, 'orders': 5000, 'instruments': 50000},
+}
+
+OPERATIONS = {
+    'select_account': lambda account: Lemon.select_account(account.auth, name='Account 2'),
+    'search_for_tradeable': lambda account: Lemon.search_for_tradeable('Siemens Tech', search_type='title'),
+    'get_value': lambda account: account.get_value(),
+    'get_orders': lambda account: account.get_orders(),
+    'create_order': lambda account: account.create_order('DE0000000001', quantity=1, buy=True),
+}
+
+def reset():
+    """Starts every operation from cold caches."""
+    Lemon.instruments = InstrumentCache(path='')
+    Lemon.catalog = InstrumentCatalog(path='')
+    Lemon.quotes = QuoteCache()
+    Lemon.transport.credentials.invalidate()
+
+def measure(operation, account):
+    reset()
+    with Trace(operation) as trace:
+        started = perf_counter()
+        OPERATIONS[operation](account)
+        elapsed = perf_counter() - started
+
+    reset()
+    tracemalloc.start()
+    OPERATIONS[operation](account)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'requests': len(trace.requests), 'seconds': elapsed, 'peak_kib': peak / 1024}
+
+def run(sizes, latency, page_size):
+    results = dict()
+    Lemon.is_market_open() # builds the trading calendar, a one-off cost that would otherwise land on whichever operation runs first
+    for size in sizes:
+        with StubServer(latency=latency, page_size=page_size, **SIZES[size]) as stub:
+            Lemon.transport = Transport(stub.url)
+            account = Lemon.select_account('Bearer benchmark')
+            for operation in OPERATIONS:
+                results['{0}/{1}'.format(size, operation)] = measure(operation, account)
+            Lemon.transport.close()
+    return results
+
+def compare(results, baseline, tolerance, slack):
+    regressions = list()
+    for key, result in results.items():
+        if key not in baseline: continue
+        before = baseline[key]
+        if result['requests'] > before['requests']:
+            regressions.append('{0}: {1} requests, was {2}'.format(key, result['requests'], before['requests']))
+        if result['seconds'] > max(before['seconds'] * (1 + tolerance), before['seconds'] + slack):
+            regressions.append('{0}: {1:.3f}s, was {2:.3f}s'.format(key, result['seconds'], before['seconds']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('sizes', nargs='*', help='any of {0}, all of them by default'.format(', '.join(SIZES)))
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds the stub server delays every response by')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='a JSON file saved earlier to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='how much slower than the saved results is still fine')
+    parser.add_argument('--slack', type=float, default=0.05, help='how many seconds slower than the saved results is always fine')
+    args = parser.parse_args()
+    for size in args.sizes:
+        if size not in SIZES: parser.error('unknown size {0}'.format(size))
+
+    results = run(args.sizes or list(SIZES), args.latency, args.page_size)
+    print('{0:<32} {1:>9} {2:>10} {3:>11}'.format('operation', 'requests', 'seconds', 'peak KiB'))
+    for key, result in results.items():
+        print('{0:<32} {1[requests]:>9} {1[seconds]:>10.3f} {1[peak_kib]:>11.1f}'.format(key, result))
+
+    if args.save:
+        with open(args.save, 'w') as f: json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f: regressions = compare(results, json.load(f), args.tolerance, args.slack)
+        for regression in regressions: print('REGRESSION', regression)
+        if regressions: sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+A local stand-in for the lemon.markets REST API, serving generated accounts, positions, orders and instruments.
+Used by the benchmarks, so they need neither credentials nor network access.
+"""
+import re
+import json
+import threading
+from time import sleep, time as unix_time
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ['Tesla', 'Apple', 'Micro', 'Soft', 'Deutsche', 'Bank', 'Siemens', 'Energy', 'Health', 'Care', 'Global', 'Tech',
+         'Holding', 'Group', 'Capital', 'Motors', 'Pharma', 'Systems', 'Networks', 'Foods', 'Airlines', 'Mining']
+TYPES = ['stock', 'stock', 'stock', 'bond', 'fond', 'warrant']
+
+class StubServer:
+    """
+    Serves the endpoints `lemon` uses from generated data, on a free local port. \n
+    `latency`: seconds every response is delayed by, to emulate the network. \n
+    `page_size`: how many results a page of a paginated listing holds. \n
+    `instruments`, `positions`, `orders`, `accounts`: how many of each to generate. \n
+    `requests` counts the requests served per `METHOD path`, with identifiers replaced by `{id}`.
+    """
+    def __init__(self, latency:float=0.0, page_size:int=100, instruments:int=1000, positions:int=10, orders:int=100, accounts:int=3):
+        self.latency = latency
+        self.page_size = page_size
+        self.instruments = [{'isin': 'DE{0:010d}'.format(i), 'wkn': 'A{0:05d}'.format(i), 'symbol': 'S{0}'.format(i),
+                             'title': '{0} {1} {2}'.format(WORDS[i % len(WORDS)], WORDS[(i // len(WORDS)) % len(WORDS)], i), 'type': TYPES[i % len(TYPES)]}
+                            for i in range(instruments)]
+        self.by_isin = {x['isin']: x for x in self.instruments}
+        self.accounts = [{'uuid': 'acc{0}'.format(i), 'name': 'Account {0}'.format(i)} for i in range(accounts)]
+        self.positions = [{'instrument': {'isin': x['isin'], 'title': x['title']}, 'quantity': 10 + i, 'average_price': 100.0 + i}
+                          for i, x in enumerate(self.instruments[:positions])]
+        self.orders = [{'uuid': 'ord{0}'.format(i), 'status': ('open', 'executed', 'deleted')[i % 3], 'side': ('buy', 'sell')[i % 2],
+                        'quantity': 1 + i % 7, 'average_price': 100.0 + i % 13, 'instrument': {'isin': self.instruments[i % len(self.instruments)]['isin']}}
+                       for i in range(orders)]
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """The base URL to point a `Transport` at."""
+        return 'http://127.0.0.1:{0}/rest/v1/'.format(self._server.server_address[1])
+
+    def start(self):
+        """Starts serving in a daemon thread and returns this server."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self): stub._handle(self, 'GET')
+            def do_POST(self): stub._handle(self, 'POST')
+            def do_DELETE(self): stub._handle(self, 'DELETE')
+            def log_message(self, *args): pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='lemon-stub', daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stops serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handle(self, handler, method):
+        split = urlsplit(handler.path)
+        path = split.path[len('/rest/v1/'):] if split.path.startswith('/rest/v1/') else split.path.lstrip('/')
+        query = {key: values[0] for key, values in parse_qs(split.query).items()}
+        length = int(handler.headers.get('Content-Length') or 0)
+        if length: handler.rfile.read(length)
+
+        with self._lock: self.requests['{0} {1}'.format(method, re.sub(r'(?<=/)((acc|ord)\d+|DE\d{10})(?=/)', '{id}', path))] += 1
+        if self.latency: sleep(self.latency)
+
+        status, body = self._route(method, path, query, handler)
+        payload = b'' if body is None else json.dumps(body).encode()
+        head = 'HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\n\r\n'.format(status, handler.responses[status][0], len(payload))
+        handler.wfile.write(head.encode() + payload) # in one write, so small responses are not held back by delayed ACKs
+
+    def _route(self, method, path, query, handler):
+        if path == 'accounts/': return 200, {'count': len(self.accounts), 'next': None, 'previous': None, 'results': self.accounts}
+        if re.fullmatch(r'accounts/\w+/state/', path): return 200, {'cash_to_invest': 100000.0, 'total_balance': 100000.0}
+        if re.fullmatch(r'accounts/\w+/portfolio/aggregated/?', path): return 200, self.positions
+        match = re.fullmatch(r'accounts/\w+/portfolio/(\w+)/aggregated/', path)
+        if match:
+            held = [x for x in self.positions if x['instrument']['isin'] == match.group(1)]
+            return 200, (held[0] if held else {})
+        if re.fullmatch(r'accounts/\w+/orders/', path):
+            if method == 'POST':
+                order = {'uuid': 'ord{0}'.format(len(self.orders)), 'status': 'open', 'average_price': None}
+                with self._lock: self.orders.append(order)
+                return 201, order
+            orders = [x for x in self.orders if 'status' not in query or x['status'] == query['status']]
+            if 'side' in query: orders = [x for x in orders if x['side'] == query['side']]
+            return 200, self._page(orders, path, query, handler)
+        match = re.fullmatch(r'accounts/\w+/orders/(\w+)/', path)
+        if match:
+            if method == 'DELETE': return 204, None
+            found = [x for x in self.orders if x['uuid'] == match.group(1)]
+            return (200, found[0]) if found else (404, {'detail': 'Not found.'})
+        if path == 'data/instruments/':
+            search = query.get('search', '').lower()
+            found = [x for x in self.instruments if search in x['title'].lower() or search in x['symbol'].lower() or search == x['isin'].lower()]
+            return 200, self._page(found, path, query, handler)
+        match = re.fullmatch(r'data/instruments/(\w+)/', path)
+        if match and match.group(1) in self.by_isin: return 200, self.by_isin[match.group(1)]
+        match = re.fullmatch(r'data/instruments/(\w+)/ticks/latest/?', path)
+        if match and match.group(1) in self.by_isin: return 200, {'price': self._get_price(match.group(1)), 'date': unix_time()}
+        match = re.fullmatch(r'data/instruments/(\w+)/candle/m1/latest/?', path)
+        if match and match.group(1) in self.by_isin:
+            price = self._get_price(match.group(1))
+            return 200, {'open': price, 'high': price, 'low': price, 'close': price, 'volume': 1, 'date': unix_time()}
+        match = re.fullmatch(r'data/instruments/(\w+)/candle/(m1|h1|d1)/', path)
+        if match and match.group(1) in self.by_isin:
+            return 200, self._page(self._get_candles(match.group(1), match.group(2), query), path, query, handler)
+        return 404, {'detail': 'Not found.'}
+
+    def _page(self, results, path, query, handler):
+        offset = int(query.get('offset', 0))
+        next_page = None
+        if offset + self.page_size < len(results):
+            params = dict(query, offset=offset + self.page_size)
+            next_page = '{0}{1}?{2}'.format(self.url, path, '&'.join('{0}={1}'.format(k, v) for k, v in params.items()))
+        return {'count': len(results), 'next': next_page, 'previous': None, 'results': results[offset:offset + self.page_size]}
+
+    def _get_candles(self, isin, resolution, query):
+        step = {'m1': 60, 'h1': 3600, 'd1': 86400}[resolution]
+        until = float(query.get('date_until', unix_time()))
+        start = -(-float(query.get('date_from', until - 100 * step)) // step) * step
+        price = self._get_price(isin)
+        return [{'date': start + i * step, 'open': price, 'high': price + 1, 'low': price - 1, 'close': price, 'volume': 1 + i % 5}
+                for i in range(int((until - start) // step) + 1)]
+
+    def _get_price(self, isin):
+        return 10.0 + int(isin[2:]) % 500
@@ -1,103 +1,1273 @@
+import os
+import json
+import struct
+import sqlite3
 import requests
-from Levenshtein import distance
-from datetime import timedelta, datetime, time
-from pytz import timezone
-from holidays import Germany
+from requests.adapters import HTTPAdapter
+from datetime import timedelta, datetime, time, timezone
+from time import sleep, monotonic, time as unix_time
+from threading import Lock, Thread, Event, Condition
+from itertools import count
+from email.utils import parsedate_to_datetime
+from bisect import bisect_left, bisect_right
+from heapq import heappush, heapreplace, heapify
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor, Future, wait, ALL_COMPLETED
+from contextvars import ContextVar, copy_context
+from functools import wraps
+
+API_URL = 'https://api.lemon.markets/rest/v1/'
 
 
 def _get_closest_string(string, iterable, length_dependant:bool=True, preprocess=lambda s: s.lower()):
-    string = preprocess(string)
-    iterable = list(filter(lambda x: x != None, iterable))
-    distances = sorted({s : distance(string, preprocess(s)) / (max(len(preprocess(s)),0.01) if length_dependant else 1) for s in iterable}.items(), key=lambda i: i[1])
-    if len(distances) > 0: return distances[0][0]
-    return string
+    matches = FuzzyMatcher(iterable, length_dependant=length_dependant, preprocess=preprocess).top(string)
+    if len(matches) > 0: return matches[0][0]
+    return preprocess(string)
+
+_levenshtein = None # (distance, supports_cutoff), only imported once needed as python-Levenshtein is slow to import
+
+def _get_levenshtein():
+    global _levenshtein
+    if _levenshtein is None:
+        from Levenshtein import distance
+        try:
+            distance('', '', score_cutoff=0)
+            _levenshtein = (distance, True)
+        except TypeError: # python-Levenshtein before 0.18 cannot stop early
+            _levenshtein = (distance, False)
+    return _levenshtein
+
+class FuzzyMatcher:
+    """
+    Finds the candidates closest to a query by Levenshtein distance. Candidates are preprocessed once, so many queries can be matched against them. \n
+    `candidates`: the strings to match against. `None`s and duplicates are ignored. \n
+    `length_dependant`: if `True`, distances are divided by the length of the candidate, so long candidates are not penalized for small differences. \n
+    `preprocess`: applied to the query and every candidate before comparing. Lowercases by default.
+    """
+    def __init__(self, candidates, length_dependant:bool=True, preprocess=lambda s: s.lower()):
+        self._distance, self._supports_cutoff = _get_levenshtein()
+        self.length_dependant = length_dependant
+        self.preprocess = preprocess
+        self.candidates = list(OrderedDict.fromkeys(c for c in candidates if c is not None))
+
+        # group by length, as the difference in length is a lower bound of the distance
+        self._by_length = dict()
+        for index, candidate in enumerate(self.candidates):
+            processed = preprocess(candidate)
+            self._by_length.setdefault(len(processed), list()).append((index, processed))
+
+    def top(self, query:str, k:int=1, max_score:float=None):
+        """
+        Returns up to `k` `(candidate, score)` tuples closest to `query`, best first. Ties go to the candidate given first. \n
+        `max_score`: only returns candidates scoring at most this. Lower is closer; `0` is an exact match.
+        """
+        query = self.preprocess(query)
+        limit = float('inf') if max_score is None else max_score
+        heap = list() # the best k so far, as (-score, -index) so the worst is on top
+
+        threshold = limit
+        for bound, length in sorted((self._get_score(abs(len(query) - length), length), length) for length in self._by_length):
+            if bound > threshold: break # no candidate of this length or any later one can do better
+
+            for index, processed in self._by_length[length]:
+                score = self._get_score(self._get_distance(query, processed, threshold, length), length)
+                if score > threshold: continue
+                if len(heap) < k: heappush(heap, (-score, -index))
+                elif (score, index) < (-heap[0][0], -heap[0][1]): heapreplace(heap, (-score, -index))
+                else: continue
+                if len(heap) >= k: threshold = -heap[0][0]
+
+        return [(self.candidates[-index], -score) for score, index in sorted(heap, reverse=True)]
+
+    def match_many(self, queries, k:int=1, max_score:float=None):
+        """
+        Matches every query against the candidates. Returns a list holding the result of `top` for each query.
+        """
+        return [self.top(query, k=k, max_score=max_score) for query in queries]
+
+    def _get_score(self, dist, length):
+        if self.length_dependant: return dist / max(length, 0.01)
+        return dist
+
+    def _get_distance(self, query, candidate, threshold, length):
+        if not self._supports_cutoff or threshold == float('inf'): return self._distance(query, candidate)
+        cutoff = int(threshold * max(length, 0.01) + 1e-9) if self.length_dependant else int(threshold) # the epsilon keeps float error from cutting off ties
+        return self._distance(query, candidate, score_cutoff=cutoff)
+
+def _iter_pages(transport, page, params=None, prefetch:bool=True, **kwargs):
+    """
+    Yields the decoded pages of a paginated listing, following their `next` links.
+    If `prefetch` is set, the next page is requested in the background while the current one is consumed.
+    """
+    def fetch(page, params=None):
+        response = transport.get(page, params=params, **kwargs)
+        response.raise_for_status(); return response.json()
+
+    pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        response = fetch(page, params)
+        while response is not None:
+            next_page = response.get('next')
+            upcoming = _submit(pool, fetch, next_page) if pool and next_page else None
+            yield response
+            if upcoming: response = upcoming.result()
+            else: response = fetch(next_page) if next_page else None
+    finally:
+        if pool: pool.shutdown(wait=False, cancel_futures=True)
+
+def _get_valid_until(length):
+    if not isinstance(length, timedelta): length = timedelta(seconds=length)
+    return ((datetime.utcnow() + length).astimezone(timezone.utc) - datetime(1970,1,1, tzinfo=timezone.utc)).total_seconds()
+
+def _prepare_order(isin, quantity, buy, price, available, slippage, limits, length, handle_errors):
+    """
+    Checks an order against the `available` funds or held quantity and returns the arguments to submit it with,
+    or `None` if `handle_errors` dropped it. Shared by `Account` and `AsyncAccount`.
+    """
+    request_args = {'instrument': isin, 'valid_until': _get_valid_until(length)}
+
+    # Set side and calculate limit based on slippage
+    if buy:
+        request_args['side'] = 'buy'
+        slippage_price = (1+slippage) * price
+    else:
+        request_args['side'] = 'sell'
+        slippage_price = (1-slippage) * price
+
+        # double-check sell quantity
+        if quantity > available:
+            if handle_errors: quantity = available
+            else: raise ValueError('You cannot sell more than you hold')
+
+    if slippage > 0: request_args['limit_price'] = slippage_price
+
+    # override for manually-set limits
+    if limits:
+        limits = sorted(limits)
+        if limits[0]:
+            request_args['stop_limit'] = limits[0]
+        if limits[1]:
+            request_args['limit_price'] = limits[1]
+
+    # double-check buy quantity
+    limit_price = request_args.get('limit_price', price)
+    if buy and quantity * limit_price > available:
+        if handle_errors: quantity = int(available/limit_price)
+        else: raise ValueError('Price limit is greater than investable funds!')
+
+    if quantity <= 0:
+        if handle_errors: return None
+        else: raise ValueError('Quantity must be greater than 0!')
+
+    request_args['quantity'] = quantity
+    return request_args
+
+def _normalize_search(search_for, search_type):
+    """
+    Returns the `search_for` and `search_type` arguments of `search_for_tradeable` as the type to filter by and the key to match,
+    each `None` if not given. Shared by `Lemon` and `AsyncLemon`.
+    """
+    if 'stock' in search_for.lower(): search_for = 'stocks'
+    elif 'bond' in search_for.lower(): search_for = 'bonds'
+    elif 'fond' in search_for.lower(): search_for = 'fonds'
+    elif 'warrant' in search_for.lower(): search_for = 'warrants'
+    else: search_for = None
+
+    if 'isin' in search_type.lower(): search_type = 'isin'
+    elif 'wkn' in search_type.lower(): search_type = 'wkn'
+    elif 'title' in search_type.lower(): search_type = 'title'
+    elif 'name' in search_type.lower(): search_type = 'title'
+    elif 'type' in search_type.lower(): search_type = 'type'
+    elif 'symbol' in search_type.lower(): search_type = 'symbol'
+    else: search_type = None
+    return search_for, search_type
+
+def _search_catalog(query, search_for, search_type):
+    """
+    Returns the details of the instrument in `Lemon.catalog` a search should answer with, or `None` if the API has to be asked.
+    Takes the arguments as returned by `_normalize_search`. Shared by `Lemon` and `AsyncLemon`.
+    """
+    if search_type == 'type' or len(Lemon.catalog) <= 0: return None
+    found = None
+
+    # without a search_type an exact isin or wkn beats any title that merely looks alike
+    exact_types = [search_type] if search_type in ('isin', 'wkn', 'symbol') else [] if search_type else ['isin', 'wkn']
+    for exact_type in exact_types:
+        found = Lemon.catalog.find(query, exact_type)
+        if found and search_for and found['type'].lower() not in search_for: found = None
+        if found: break
+    if not found and search_type in (None, 'title'):
+        found = Lemon.catalog.search(query, limit=25, types=search_for, min_similarity=0.5)
+        if found and search_type:
+            titles = [x['title'] for x in found]
+            found = found[titles.index(_get_closest_string(query, titles, length_dependant=False))]
+        elif found: found = found[0]
+    return dict(found, name=found['title']) if found else None
+
+class CredentialCache:
+    """
+    Remembers which authentication keys were validated recently, so `Lemon.validate_key` only reaches the API once per `ttl`. \n
+    `ttl`: a `timedelta` or number of seconds a validation stays trusted. \n
+    A key is forgotten as soon as any request made with it is answered with `401` or `403`.
+    """
+    def __init__(self, ttl=timedelta(minutes=5)):
+        self.ttl = ttl.total_seconds() if isinstance(ttl, timedelta) else ttl
+        self._expiries = dict()
+        self._lock = Lock()
+
+    def is_valid(self, auth):
+        """Returns `True` if `auth` was validated within the last `ttl`."""
+        with self._lock:
+            expiry = self._expiries.get(auth)
+            if expiry is None: return False
+            if expiry <= monotonic():
+                del self._expiries[auth]
+                return False
+            return True
+
+    def add(self, auth):
+        """Marks `auth` as valid for the next `ttl`."""
+        with self._lock:
+            self._expiries[auth] = monotonic() + self.ttl
+
+    def invalidate(self, auth=None):
+        """Forgets `auth`, or every key if none is given."""
+        with self._lock:
+            if auth is None: self._expiries.clear()
+            else: self._expiries.pop(auth, None)
+
+class RequestScheduler:
+    """
+    Keeps requests within the API's rate limits, with a token bucket per credential, and lets more urgent requests go first while they wait. \n
+    `rate`: how many requests per second each credential may send. Unauthenticated requests share one bucket. \n
+    `burst`: how many requests a credential may send at once after a quiet period. \n
+    Waiting requests are served by priority: `ORDERS` first, then `ACCOUNT`, `MARKET_DATA` and `METADATA`, and in arrival order within one.
+    """
+    ORDERS, ACCOUNT, MARKET_DATA, METADATA = range(4)
+    PRIORITY_NAMES = ('orders', 'account', 'market_data', 'metadata')
+
+    def __init__(self, rate:float=10, burst:int=10):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = dict() # credential -> [tokens, last refill, paused until, heap of waiting (priority, ticket)]
+        self._tickets = count()
+        self._condition = Condition()
+        self._waits = [[0, 0.0, 0.0] for _ in self.PRIORITY_NAMES] # per priority: requests, total and longest wait in seconds
+
+    @classmethod
+    def classify(cls, method:str, url:str):
+        """
+        Returns the priority of a request: creating or deleting orders, reading accounts, reading prices, or reading instrument details.
+        """
+        if '/orders/' in url and method.upper() in ('POST', 'DELETE'): return cls.ORDERS
+        if '/ticks/' in url or '/candle/' in url: return cls.MARKET_DATA
+        if '/accounts/' in url: return cls.ACCOUNT
+        return cls.METADATA
+
+    def acquire(self, credential, priority:int):
+        """
+        Blocks until a request of the given `priority` may be sent with `credential`. Returns how many seconds it waited.
+        """
+        started = monotonic()
+        ticket = (priority, next(self._tickets))
+        with self._condition:
+            bucket = self._buckets.setdefault(credential, [self.burst, started, 0.0, list()])
+            heappush(bucket[3], ticket)
+            try:
+                while True:
+                    now = monotonic()
+                    bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                    bucket[1] = now
+                    delay = max(bucket[2] - now, (1 - bucket[0]) / self.rate)
+                    if bucket[3][0] == ticket and delay <= 0: break
+                    # only the first in line needs to wake up on its own, the rest wait for it to go
+                    self._condition.wait(delay if bucket[3][0] == ticket else None)
+                bucket[0] -= 1
+            finally:
+                bucket[3].remove(ticket); heapify(bucket[3])
+                self._condition.notify_all() # the next in line may be able to go as well
+
+            waited = monotonic() - started
+            stats = self._waits[priority]
+            stats[0] += 1; stats[1] += waited; stats[2] = max(stats[2], waited)
+        return waited
+
+    def pause(self, credential, seconds:float):
+        """
+        Holds back every request of `credential` for `seconds`, such as when the API answered with `429 Too Many Requests`.
+        """
+        with self._condition:
+            bucket = self._buckets.setdefault(credential, [self.burst, monotonic(), 0.0, list()])
+            bucket[2] = max(bucket[2], monotonic() + seconds)
+            bucket[0] = min(bucket[0], 0)
+            self._condition.notify_all()
+
+    def get_stats(self):
+        """
+        Returns, per priority name, how many requests were scheduled and their `mean_wait` and `max_wait` in seconds.
+        """
+        with self._condition:
+            return {name: {'requests': n, 'mean_wait': total / n if n else 0.0, 'max_wait': longest}
+                    for name, (n, total, longest) in zip(self.PRIORITY_NAMES, self._waits)}
+
+class RequestMetrics:
+    """
+    Aggregates the requests made through a `Transport` per endpoint: how many were made, failed and retried,
+    how many bytes they sent and received, and a histogram of their latencies.
+    Endpoints are the method and the path with instrument and account identifiers replaced by `{id}`.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # upper bounds in seconds
+    ID_AFTER = frozenset(('accounts', 'orders', 'instruments', 'portfolio')) # path segments followed by an identifier
+    NOT_IDS = frozenset(('aggregated', 'state', 'orders', 'portfolio', 'ticks', 'candle'))
+
+    def __init__(self):
+        self._endpoints = dict() # (method, endpoint) -> statistics
+        self._lock = Lock()
+
+    @classmethod
+    def get_endpoint(cls, url:str, base_url:str=API_URL):
+        """
+        Returns the endpoint of `url`, such as `accounts/{id}/orders/`.
+        """
+        url = url.split('?', 1)[0]
+        path = url[len(base_url):] if url.startswith(base_url) else url.split('://', 1)[-1]
+        segments = path.split('/')
+        for i in range(1, len(segments)):
+            if segments[i - 1] in cls.ID_AFTER and segments[i] and segments[i] not in cls.NOT_IDS: segments[i] = '{id}'
+        return '/'.join(segments)
+
+    def record(self, record:dict):
+        """Adds a request record, as passed to `Transport` hooks, to the statistics."""
+        key = (record['method'], record['endpoint'])
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = {'requests': 0, 'errors': 0, 'retries': 0, 'bytes_sent': 0, 'bytes_received': 0,
+                                                'latency_sum': 0.0, 'latency_buckets': [0] * (len(self.BUCKETS) + 1)}
+            stats['requests'] += 1
+            stats['errors'] += record['error'] is not None or record['status'] >= 400
+            stats['retries'] += record['attempt'] > 0
+            stats['bytes_sent'] += record['bytes_sent']
+            stats['bytes_received'] += record['bytes_received']
+            stats['latency_sum'] += record['elapsed']
+            stats['latency_buckets'][bisect_left(self.BUCKETS, record['elapsed'])] += 1
+
+    def snapshot(self):
+        """
+        Returns the statistics as a list of dictionaries, one per endpoint. `latency_buckets` counts requests up to each bound of `BUCKETS`, the last one being slower than all.
+        """
+        with self._lock:
+            return [dict(stats, method=method, endpoint=endpoint, latency_buckets=list(stats['latency_buckets']))
+                    for (method, endpoint), stats in sorted(self._endpoints.items())]
+
+    def to_json(self):
+        """Returns `snapshot` as a JSON string."""
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix:str='lemon'):
+        """Returns the statistics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = list()
+        for name, field, kind in (('requests_total', 'requests', 'counter'), ('request_errors_total', 'errors', 'counter'),
+                                  ('request_retries_total', 'retries', 'counter'), ('request_bytes_sent_total', 'bytes_sent', 'counter'),
+                                  ('request_bytes_received_total', 'bytes_received', 'counter')):
+            lines.append('# TYPE {0}_{1} {2}'.format(prefix, name, kind))
+            lines.extend('{0}_{1}{{{2}}} {3}'.format(prefix, name, self._get_labels(x), x[field]) for x in snapshot)
+
+        lines.append('# TYPE {0}_request_duration_seconds histogram'.format(prefix))
+        for x in snapshot:
+            labels, cumulative = self._get_labels(x), 0
+            for bound, n in zip(self.BUCKETS + ('+Inf',), x['latency_buckets']):
+                cumulative += n
+                lines.append('{0}_request_duration_seconds_bucket{{{1},le="{2}"}} {3}'.format(prefix, labels, bound, cumulative))
+            lines.append('{0}_request_duration_seconds_sum{{{1}}} {2}'.format(prefix, labels, x['latency_sum']))
+            lines.append('{0}_request_duration_seconds_count{{{1}}} {2}'.format(prefix, labels, x['requests']))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Forgets all statistics."""
+        with self._lock: self._endpoints.clear()
+
+    @staticmethod
+    def _get_labels(stats):
+        return 'method="{0}",endpoint="{1}"'.format(stats['method'], stats['endpoint'].replace('\\', '\\\\').replace('"', '\\"'))
+
+class Trace:
+    """
+    Groups every request made while it is active, including those made by worker threads of `lemon`. \n
+    `name`: what is traced. Methods of `Lemon`, `Account` and `Order` trace themselves under their qualified name, such as `Account.get_value`. \n
+    Use it as a context manager. Traces nest: a request is recorded in the innermost trace and every trace around it.
+    Once a trace ends, it is passed to every callable in `Trace.hooks`.
+    """
+    hooks = list()
+
+    def __init__(self, name:str):
+        self.name = name
+        self.parent = None
+        self.requests = list() # the records passed to `Transport` hooks
+        self.started = None
+        self.elapsed = None
+        self._token = None
+
+    def summary(self):
+        """
+        Returns a dictionary of this trace's `name`, `elapsed` seconds, the number of `requests`, `errors` and `retries`,
+        the `bytes_received`, and the number of requests per endpoint.
+        """
+        return {'name': self.name, 'elapsed': self.elapsed, 'requests': len(self.requests),
+                'errors': sum(1 for r in self.requests if r['error'] is not None or r['status'] >= 400),
+                'retries': sum(1 for r in self.requests if r['attempt'] > 0),
+                'bytes_received': sum(r['bytes_received'] for r in self.requests),
+                'endpoints': dict(Counter('{0} {1}'.format(r['method'], r['endpoint']) for r in self.requests))}
+
+    def __enter__(self):
+        self.parent = _current_trace.get()
+        self._token = _current_trace.set(self)
+        self.started = monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = monotonic() - self.started
+        _current_trace.reset(self._token)
+        for hook in Trace.hooks: hook(self)
+
+_current_trace = ContextVar('lemon_trace', default=None)
+
+def _traced(function):
+    """Runs `function` inside a `Trace` named after it, if anyone is listening."""
+    @wraps(function)
+    def traced(*args, **kwargs):
+        if not Trace.hooks and _current_trace.get() is None: return function(*args, **kwargs)
+        with Trace(function.__qualname__): return function(*args, **kwargs)
+    return traced
+
+def _submit(pool, function, *args):
+    """Submits `function` to `pool` within the current context, so its requests are recorded in the active `Trace`."""
+    return pool.submit(copy_context().run, function, *args)
+
+class Transport:
+    """
+    A pooled, keep-alive HTTP transport. Every request made by `Lemon`, `Account`, `Order` and `Tradeable` is routed through one. \n
+    `base_url`: the root relative paths are resolved against. Point it at a local server to stub lemon.markets. \n
+    `timeout`: the default `(connect, read)` timeout in seconds. Can be overridden per request. \n
+    `retries`: how often idempotent requests are retried on connection errors and 5xx responses. \n
+    `backoff`: the delay in seconds before the first retry. Doubles on every further attempt. \n
+    `pool_connections`: how many hosts to keep connection pools for. \n
+    `pool_maxsize`: how many keep-alive connections to hold per host. Should be at least the number of threads sharing this transport. \n
+    `session`: an optional preconfigured `requests.Session` to use instead of a fresh one. Its adapters are kept, so `pool_connections` and `pool_maxsize` only apply to a fresh one. \n
+    `credentials`: the `CredentialCache` of keys validated over this transport. A fresh one by default. \n
+    `scheduler`: an optional `RequestScheduler` every request has to pass first, to stay within rate limits. \n
+    Requests answered with `429 Too Many Requests` are retried after the `Retry-After` the API asked for, whatever their method. \n
+    `metrics`: the `RequestMetrics` every request is recorded in. A fresh one by default. \n
+    `hooks`: callables passed a dictionary for every request sent, holding its `method`, `url`, `endpoint`, `status` (`0` if it failed to connect),
+    `error`, `attempt` (`0` unless it is a retry), `elapsed` seconds, `bytes_sent`, `bytes_received` and `trace`, the active `Trace` or `None`.
+    """
+    RETRY_STATUSES = frozenset((500, 502, 503, 504))
+    IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'DELETE'))
+
+    def __init__(self, base_url:str=API_URL, timeout=(3.05, 10), retries:int=3, backoff:float=0.25, pool_connections:int=4, pool_maxsize:int=32, session:requests.Session=None, credentials:CredentialCache=None, scheduler:RequestScheduler=None, metrics:RequestMetrics=None, hooks:list=None):
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.credentials = credentials or CredentialCache()
+        self.scheduler = scheduler
+        self.metrics = metrics or RequestMetrics()
+        self.hooks = list(hooks or ())
+
+        # a given session keeps its own adapters, such as those of a test stub
+        self.session = session
+        if session is None:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+
+    def url(self, path:str):
+        """
+        Resolves `path` against this transport's `base_url`. Absolute URLs, such as pagination links, are returned as is.
+        """
+        if path.startswith(('http://', 'https://')): return path
+        return self.base_url + path.lstrip('/')
+
+    def request(self, method:str, path:str, retries:int=None, priority:int=None, **kwargs):
+        """
+        Sends a request over the pooled session and returns the `requests.Response`. \n
+        `retries`: overrides the retry count of this transport. Requests that are not idempotent, such as creating an order, are only retried on `429`. \n
+        `priority`: overrides the `RequestScheduler` priority, which is otherwise derived from the method and path. \n
+        Any other keyword arguments are passed on to `requests.Session.request`.
+        """
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        idempotent = method in self.IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+
+        url = self.url(path)
+        credential = (kwargs.get('headers') or {}).get('Authorization')
+        if self.scheduler and priority is None: priority = self.scheduler.classify(method, url)
+        for attempt in range(retries + 1):
+            if self.scheduler: self.scheduler.acquire(credential, priority)
+            started = monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self._record(method, url, attempt, started, None, e)
+                if attempt >= retries or not idempotent or not isinstance(e, requests.exceptions.ConnectionError): raise
+                delay = self.backoff * 2 ** attempt
+            else:
+                self._record(method, url, attempt, started, response, None)
+                if response.status_code in (401, 403) and credential:
+                    self.credentials.invalidate(credential)
+                if attempt >= retries: return response
+                if response.status_code == 429:
+                    delay = self._get_retry_after(response, self.backoff * 2 ** attempt)
+                    if self.scheduler:
+                        self.scheduler.pause(credential, delay)
+                        delay = 0 # the scheduler holds this request back along with every other
+                elif idempotent and response.status_code in self.RETRY_STATUSES: delay = self.backoff * 2 ** attempt
+                else: return response
+                response.close()
+            sleep(delay)
+
+    def add_hook(self, hook):
+        """Calls `hook` with a dictionary describing every request sent from now on. See `Transport` for its keys."""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """Stops calling a `hook` added with `add_hook`."""
+        self.hooks.remove(hook)
+
+    def _record(self, method, url, attempt, started, response, error):
+        body = response.request.body if response is not None else None
+        record = {'method': method, 'url': url, 'endpoint': RequestMetrics.get_endpoint(url, self.base_url),
+                  'status': response.status_code if response is not None else 0, 'error': error, 'attempt': attempt,
+                  'elapsed': monotonic() - started, 'bytes_sent': len(body) if body else 0,
+                  'bytes_received': len(response.content) if response is not None else 0, 'trace': _current_trace.get()}
+        self.metrics.record(record)
+        trace = record['trace']
+        while trace is not None:
+            trace.requests.append(record)
+            trace = trace.parent
+        for hook in self.hooks: hook(record)
+
+    @staticmethod
+    def _get_retry_after(response, default):
+        retry_after = response.headers.get('Retry-After')
+        if not retry_after: return default
+        try: return max(0.0, float(retry_after))
+        except ValueError: pass
+        try: return max(0.0, parsedate_to_datetime(retry_after).timestamp() - unix_time())
+        except (TypeError, ValueError): return default
+
+    def get(self, path:str, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path:str, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path:str, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        """Closes all pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class InstrumentCache:
+    """
+    Caches the details of instruments by `isin`, as they practically never change. \n
+    `maxsize`: how many instruments to keep in memory. The least recently used are dropped first. \n
+    `ttl`: a `timedelta` or number of seconds after which details are fetched again. `1 day` by default. \n
+    `path`: an SQLite database to persist details to, so they survive restarts and are shared between processes.
+    Defaults to the `LEMON_INSTRUMENT_CACHE` environment variable, or to memory only if it is unset.
+    """
+    REQUIRED_FIELDS = ('isin', 'wkn', 'name', 'type', 'symbol')
+
+    def __init__(self, maxsize:int=4096, ttl=timedelta(days=1), path:str=None):
+        self.maxsize = maxsize
+        self.ttl = ttl.total_seconds() if isinstance(ttl, timedelta) else ttl
+        self.path = path if path is not None else os.environ.get('LEMON_INSTRUMENT_CACHE')
+        self._memory = OrderedDict() # isin -> (expiry, details)
+        self._db = None
+        self._lock = Lock()
+
+    def get(self, isin:str, transport:Transport=None):
+        """
+        Returns the details of the instrument with the given `isin`.
+        Only reaches the API if they are neither in memory nor on disk, or have expired.
+        """
+        details = self.peek(isin)
+        if details is not None: return details
+
+        req = (transport or Lemon.transport).get('data/instruments/{0}/'.format(isin))
+        req.raise_for_status(); req = req.json()
+        req['name'] = req['title']; del req['title']
+        self.put(isin, req)
+        return dict(req)
+
+    def peek(self, isin:str):
+        """
+        Returns the cached details of the instrument with the given `isin`, or `None` if they are not cached.
+        """
+        with self._lock:
+            entry = self._memory.get(isin)
+            if entry is None:
+                entry = self._read(isin)
+                if entry is None: return None
+                self._remember(isin, entry)
+            if entry[0] <= unix_time():
+                del self._memory[isin]
+                return None
+            self._memory.move_to_end(isin)
+            return dict(entry[1])
+
+    def put(self, isin:str, details:dict):
+        """
+        Stores the `details` of an instrument. They must contain its `wkn`, `name`, `type` and `symbol`.
+        """
+        entry = (unix_time() + self.ttl, dict(details))
+        with self._lock:
+            self._remember(isin, entry)
+            db = self._connect()
+            if db:
+                with db: db.execute('INSERT OR REPLACE INTO instruments VALUES (?, ?, ?)', (isin, entry[0], json.dumps(entry[1])))
+
+    def invalidate(self, isin:str=None):
+        """Forgets the instrument with the given `isin`, or every instrument if none is given."""
+        with self._lock:
+            if isin is None: self._memory.clear()
+            else: self._memory.pop(isin, None)
+            db = self._connect()
+            if db:
+                with db:
+                    if isin is None: db.execute('DELETE FROM instruments')
+                    else: db.execute('DELETE FROM instruments WHERE isin = ?', (isin,))
+
+    def _remember(self, isin, entry):
+        self._memory[isin] = entry
+        self._memory.move_to_end(isin)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _read(self, isin):
+        db = self._connect()
+        if not db: return None
+        row = db.execute('SELECT expiry, details FROM instruments WHERE isin = ?', (isin,)).fetchone()
+        if row is None: return None
+        return row[0], json.loads(row[1])
+
+    def _connect(self):
+        if self._db is None and self.path:
+            self._db = sqlite3.connect(os.path.expanduser(self.path), timeout=30, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            with self._db: self._db.execute('CREATE TABLE IF NOT EXISTS instruments (isin TEXT PRIMARY KEY, expiry REAL, details TEXT)')
+        return self._db
+
+class TradingCalendar:
+    """
+    Precomputed trading sessions of the market, von https://www.ls-tc.de/de/handelszeiten. \n
+    Sessions are kept as sorted arrays of opening and closing times, so every lookup is a binary search. \n
+    `years`: a `(first, last)` tuple of years to precompute on the first lookup. By default only the years looked up are computed.
+    Lookups outside of it extend the range a year at a time. \n
+    `path`: a JSON file to load precomputed sessions from, written by `save`. Defaults to the `LEMON_TRADING_CALENDAR` environment variable,
+    or to `lemon/trading_calendar.json` in the user's cache directory if it is unset. An empty string keeps the sessions in memory only.
+    Sessions are computed, and written to it, only for the years it does not cover, so only the first process pays for them. \n
+    Nothing is computed or loaded until the first lookup.
+    """
+    TIMEZONE = 'Europe/Berlin' # The market is in the MEZ/MESZ timezone. So is Berlin.
+    PROVINCE = 'NW'
+    SESSIONS = [((7,30), (23,00))] * 5 + [((10,00), (13,00)), ((17,00), (19,00))] # (opening, closing) per weekday
+
+    def __init__(self, years:tuple=None, path:str=None):
+        if path is None: path = os.environ.get('LEMON_TRADING_CALENDAR', os.path.join(os.environ.get('XDG_CACHE_HOME') or '~/.cache', 'lemon', 'trading_calendar.json'))
+        self.path = path
+        self._requested_years = years
+        self._years = None
+        self._openings = list() # seconds since epoch
+        self._closings = list()
+        self._lock = Lock()
+
+    def is_open(self, timestamp:datetime=None):
+        """
+        Returns if the market is open at the given `datetime`, or now if none is given.
+        """
+        seconds = self._get_seconds(timestamp)
+        openings, closings = self._get_sessions(seconds)
+        index = bisect_right(openings, seconds) - 1
+        return index >= 0 and seconds <= closings[index]
+
+    def next_opening(self, timestamp:datetime=None):
+        """
+        Returns the first market opening at or after the given `datetime`, or now if none is given, in the timezone of the given `datetime`.
+        """
+        seconds = self._get_seconds(timestamp)
+        openings, _ = self._get_sessions(seconds)
+        index = bisect_left(openings, seconds)
+        if index >= len(openings): openings, _ = self._get_sessions(seconds + 366 * 86400)
+        return self._to_datetime(openings[index], timestamp)
+
+    def next_closing(self, timestamp:datetime=None):
+        """
+        Returns the first market closing at or after the given `datetime`, or now if none is given, in the timezone of the given `datetime`.
+        """
+        seconds = self._get_seconds(timestamp)
+        _, closings = self._get_sessions(seconds)
+        index = bisect_left(closings, seconds)
+        if index >= len(closings): _, closings = self._get_sessions(seconds + 366 * 86400)
+        return self._to_datetime(closings[index], timestamp)
+
+    def is_open_many(self, timestamps):
+        """
+        Classifies a whole array of timestamps at once. Requires `numpy`. \n
+        `timestamps`: an array of `numpy.datetime64` (taken as UTC) or of seconds since epoch. \n
+        Returns a boolean `numpy` array, `True` where the market is open.
+        """
+        import numpy as np
+        seconds = self._get_seconds_many(timestamps)
+        if len(seconds) <= 0: return np.zeros(0, dtype=bool)
+        openings, closings = (np.asarray(x) for x in self._get_sessions(seconds.min(), seconds.max()))
+        index = np.searchsorted(openings, seconds, side='right') - 1
+        return (index >= 0) & (seconds <= closings[np.maximum(index, 0)])
+
+    def next_openings_many(self, timestamps):
+        """
+        Returns the first market opening at or after every timestamp of an array, as seconds since epoch. Requires `numpy`. \n
+        `timestamps`: an array of `numpy.datetime64` (taken as UTC) or of seconds since epoch.
+        """
+        return self._next_many(timestamps, 0)
+
+    def next_closings_many(self, timestamps):
+        """
+        Returns the first market closing at or after every timestamp of an array, as seconds since epoch. Requires `numpy`. \n
+        `timestamps`: an array of `numpy.datetime64` (taken as UTC) or of seconds since epoch.
+        """
+        return self._next_many(timestamps, 1)
+
+    def _next_many(self, timestamps, column):
+        import numpy as np
+        seconds = self._get_seconds_many(timestamps)
+        if len(seconds) <= 0: return np.zeros(0)
+        edges = np.asarray(self._get_sessions(seconds.min(), seconds.max() + 366 * 86400)[column])
+        return edges[np.searchsorted(edges, seconds, side='left')]
+
+    def _get_sessions(self, *seconds):
+        # Berlin is at most two hours ahead of UTC, and no session spans midnight
+        first = datetime.fromtimestamp(min(seconds), timezone.utc).year
+        last = datetime.fromtimestamp(max(seconds) + 7200, timezone.utc).year
+        with self._lock:
+            if self._years is None:
+                if self._requested_years: first, last = min(first, self._requested_years[0]), max(last, self._requested_years[1])
+                self._load()
+            if self._years is None: self._extend(first, last)
+            elif first < self._years[0] or last > self._years[1]: self._extend(min(first, self._years[0]), max(last, self._years[1]))
+            return self._openings, self._closings
+
+    def save(self, path:str=None):
+        """
+        Writes the sessions to a JSON file, `path` of this calendar by default, so later processes can load them instead of computing them.
+        Computes them first if no lookup did yet.
+        """
+        path = path or self.path
+        if not path: raise ValueError('No path given to save the trading calendar to')
+        self._get_sessions(unix_time())
+        with self._lock: self._write(path)
+
+    def _load(self):
+        if not self.path: return
+        try:
+            with open(os.path.expanduser(self.path)) as f: saved = json.load(f)
+            if saved['settings'] != self._get_settings(): return
+            self._openings, self._closings, self._years = saved['openings'], saved['closings'], tuple(saved['years'])
+        except (OSError, ValueError, KeyError, TypeError): pass # missing or not written by this version; computed anew
+
+    def _write(self, path):
+        # write next to it and swap it in, so other processes never read a half written file
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump({'settings': self._get_settings(), 'years': self._years, 'openings': self._openings, 'closings': self._closings}, f, separators=(',', ':'))
+        os.replace(temporary, path)
+
+    def _get_settings(self):
+        return json.loads(json.dumps([self.TIMEZONE, self.PROVINCE, self.SESSIONS])) # as read back from JSON, tuples turned lists
+
+    def _extend(self, first, last):
+        # only the years not computed yet are built
+        if self._years is None: openings, closings = self._build(first, last)
+        else:
+            before, after = self._build(first, self._years[0] - 1), self._build(self._years[1] + 1, last)
+            openings = before[0] + self._openings + after[0]
+            closings = before[1] + self._closings + after[1]
+
+        # swap in whole lists, so readers holding the old ones are never disturbed
+        self._openings, self._closings = openings, closings
+        self._years = (first, last)
+        if self.path:
+            try: self._write(self.path)
+            except OSError: pass # the calendar works without, it is only slower to start
+
+    def _build(self, first, last):
+        if first > last: return list(), list()
+        # both are slow to import and not needed at all once the sessions are saved
+        import pytz
+        from holidays import Germany
+        berlin = pytz.timezone(self.TIMEZONE)
+        holidays = Germany(prov=self.PROVINCE, years=range(first, last + 1))
+        openings, closings = list(), list()
+
+        day = datetime(first, 1, 1).date()
+        while day.year <= last:
+            if day not in holidays:
+                opening, closing = self.SESSIONS[day.weekday()]
+                # daylight saving time changes at night, so one localization serves the whole session
+                seconds = berlin.localize(datetime.combine(day, time(*opening))).timestamp()
+                openings.append(seconds)
+                closings.append(seconds + (closing[0] - opening[0]) * 3600 + (closing[1] - opening[1]) * 60)
+            day += timedelta(days=1)
+        return openings, closings
+
+    @staticmethod
+    def _get_seconds(timestamp):
+        if timestamp is None: return unix_time()
+        return timestamp.timestamp()
+
+    @staticmethod
+    def _get_seconds_many(timestamps):
+        import numpy as np
+        timestamps = np.asarray(timestamps)
+        if np.issubdtype(timestamps.dtype, np.datetime64): return timestamps.astype('datetime64[us]').astype(np.int64) / 1e6
+        return timestamps.astype(np.float64)
+
+    @staticmethod
+    def _to_datetime(seconds, timestamp):
+        if timestamp is None or timestamp.tzinfo is None: return datetime.fromtimestamp(seconds).astimezone()
+        return datetime.fromtimestamp(seconds, tz=timestamp.tzinfo)
+
+class InstrumentCatalog:
+    """
+    A local, searchable copy of the instruments listed by lemon.markets, so lookups need no network access. \n
+    Every instrument is indexed by `isin`, `wkn` and `symbol`, and its `title` by trigrams. \n
+    `path`: an SQLite database to persist the catalog to. Defaults to the `LEMON_INSTRUMENT_CATALOG` environment variable, or to memory only if it is unset. \n
+    The catalog starts out empty; fill it with `sync` or keep it fresh with `start_refreshing`.
+    """
+    def __init__(self, path:str=None):
+        self.path = path if path is not None else os.environ.get('LEMON_INSTRUMENT_CATALOG')
+        self.synced_at = None # seconds since epoch of the last completed sync
+        self._instruments = dict() # isin -> instrument
+        self._indexes = {'wkn': dict(), 'symbol': dict()} # lowercased key -> isin
+        self._trigrams = dict() # trigram -> set of isins
+        self._cursor = None # the next page of an unfinished sync
+        self._seen = set() # isins listed since the unfinished sync started
+        self._db = None
+        self._loaded = False
+        self._lock = Lock()
+        self._stop = Event()
+        self._refresher = None
+
+    def get(self, isin:str):
+        """
+        Returns the instrument with the given `isin`, or `None` if it is not in the catalog.
+        """
+        self._load()
+        with self._lock: return self._instruments.get(isin.upper())
+
+    def find(self, query:str, search_type:str='isin'):
+        """
+        Returns the instrument whose `isin`, `wkn` or `symbol` exactly matches `query`, ignoring case, or `None`.
+        For `title`, returns the best match of `search`.
+        """
+        if search_type == 'title':
+            found = self.search(query, limit=1)
+            return found[0] if found else None
+        self._load()
+        with self._lock:
+            if search_type == 'isin': return self._instruments.get(query.upper())
+            isin = self._indexes[search_type].get(query.lower())
+            return self._instruments.get(isin) if isin else None
+
+    def search(self, query:str, limit:int=10, types:str=None, min_similarity:float=0):
+        """
+        Returns up to `limit` instruments whose titles share the most trigrams with `query`, best first. \n
+        `types`: only returns instruments whose `type` is contained in this string, such as `stocks`. \n
+        `min_similarity`: only returns instruments sharing at least this fraction of the trigrams of `query`, from `0` to `1`.
+        """
+        self._load()
+        trigrams = self._get_trigrams(query)
+        counts = Counter()
+        found = list()
+        # the refresh thread changes the indexes while syncing, so they are only read under the lock
+        with self._lock:
+            for trigram in trigrams:
+                counts.update(self._trigrams.get(trigram, ()))
+
+            for isin, shared in sorted(counts.items(), key=lambda i: (-i[1], len(self._instruments[i[0]]['title']))):
+                if shared < min_similarity * len(trigrams): break
+                instrument = self._instruments[isin]
+                if types and instrument['type'].lower() not in types: continue
+                found.append(instrument)
+                if len(found) >= limit: break
+        return found
+
+    def sync(self, transport:Transport=None, max_pages:int=None):
+        """
+        Downloads the instrument listing page by page into the catalog. Every page is stored as soon as it arrives,
+        so an interrupted sync resumes where it stopped. Once the whole listing was synced, instruments no longer listed are removed. \n
+        `max_pages`: stops after this many pages. Call `sync` again to continue. \n
+        Returns `True` once the whole listing was synced.
+        """
+        self._load()
+        transport = transport or Lemon.transport
+        if self._cursor is None:
+            with self._lock:
+                self._seen.clear()
+                db = self._connect()
+                if db:
+                    with db: db.execute('DELETE FROM seen')
+        page = self._cursor or 'data/instruments/'
+        pages = 0
+        while page and (max_pages is None or pages < max_pages):
+            response = transport.get(page)
+            response.raise_for_status(); response = response.json()
+            page = response['next']
+            self._store(response['results'], page)
+            pages += 1
+
+        if page: return False
+        with self._lock:
+            # an empty listing is more likely a fault of the API than every instrument delisted
+            delisted = set(self._instruments) - self._seen if self._seen else set()
+            for isin in delisted: self._unindex(isin)
+            self._cursor, self.synced_at = None, unix_time()
+            self._seen.clear()
+            db = self._connect()
+            if db:
+                with db:
+                    db.executemany('DELETE FROM instruments WHERE isin = ?', ((isin,) for isin in delisted))
+                    db.execute('DELETE FROM seen')
+            self._write_meta()
+        return True
+
+    def start_refreshing(self, interval=timedelta(days=1), transport:Transport=None):
+        """
+        Syncs the catalog in a background thread whenever it is older than `interval`, a `timedelta` or number of seconds.
+        """
+        if self._refresher is not None and self._refresher.is_alive(): return
+        interval = interval.total_seconds() if isinstance(interval, timedelta) else interval
+        self._stop.clear()
+
+        def refresh():
+            while not self._stop.is_set():
+                self._load()
+                if self.synced_at is None or self.synced_at + interval <= unix_time():
+                    try: self.sync(transport=transport)
+                    except (requests.exceptions.RequestException, ValueError, KeyError): pass # retried on the next round
+                self._stop.wait(min(interval, 60))
+
+        self._refresher = Thread(target=refresh, name='lemon-catalog', daemon=True)
+        self._refresher.start()
+
+    def stop_refreshing(self):
+        """Stops the background refresh started by `start_refreshing`."""
+        self._stop.set()
+
+    def __len__(self):
+        self._load()
+        with self._lock: return len(self._instruments)
+
+    def __contains__(self, isin):
+        return self.get(isin) is not None
+
+    def _store(self, instruments, cursor):
+        with self._lock:
+            for instrument in instruments:
+                self._index(instrument)
+            self._seen.update(x['isin'] for x in instruments)
+            self._cursor = cursor
+            db = self._connect()
+            if db:
+                with db:
+                    db.executemany('INSERT OR REPLACE INTO instruments VALUES (?, ?)', ((x['isin'], json.dumps(x)) for x in instruments))
+                    db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((x['isin'],) for x in instruments))
+                    self._write_meta()
+
+    def _index(self, instrument):
+        isin = instrument['isin']
+        self._unindex(isin)
+        self._instruments[isin] = instrument
+        for key, index in self._indexes.items():
+            if instrument.get(key): index[instrument[key].lower()] = isin
+        for trigram in self._get_trigrams(instrument.get('title') or ''):
+            self._trigrams.setdefault(trigram, set()).add(isin)
+
+    def _unindex(self, isin):
+        old = self._instruments.pop(isin, None)
+        if old is None: return
+        for key, index in self._indexes.items():
+            if old.get(key) and index.get(old[key].lower()) == isin: del index[old[key].lower()]
+        for trigram in self._get_trigrams(old.get('title') or ''):
+            self._trigrams[trigram].discard(isin)
+
+    @staticmethod
+    def _get_trigrams(text):
+        text = ' {0} '.format(' '.join(text.lower().split()))
+        return set(text[i:i+3] for i in range(len(text) - 2))
+
+    def _load(self):
+        if self._loaded: return
+        with self._lock:
+            if self._loaded: return
+            db = self._connect()
+            if db:
+                for (data,) in db.execute('SELECT data FROM instruments'): self._index(json.loads(data))
+                self._seen.update(isin for (isin,) in db.execute('SELECT isin FROM seen'))
+                meta = dict(db.execute('SELECT key, value FROM meta'))
+                self._cursor = meta.get('cursor') or None
+                self.synced_at = float(meta['synced_at']) if meta.get('synced_at') else None
+            self._loaded = True
+
+    def _write_meta(self):
+        db = self._connect()
+        if not db: return
+        with db: db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', (('cursor', self._cursor or ''), ('synced_at', str(self.synced_at or ''))))
+
+    def _connect(self):
+        if self._db is None and self.path:
+            self._db = sqlite3.connect(os.path.expanduser(self.path), timeout=30, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            with self._db:
+                self._db.execute('CREATE TABLE IF NOT EXISTS instruments (isin TEXT PRIMARY KEY, data TEXT)')
+                self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+                self._db.execute('CREATE TABLE IF NOT EXISTS seen (isin TEXT PRIMARY KEY)')
+        return self._db
+
+class QuoteCache:
+    """
+    Keeps the latest prices of instruments, so reading one rarely waits on a request. \n
+    `max_age`: the default number of seconds a price may be old to be returned by `get`. \n
+    `interval`: seconds between background refreshes of the subscribed instruments. \n
+    `timeout_limit`: passed on to `Lemon.get_tradeable_cost`. \n
+    Concurrent reads of one instrument that miss share a single request. While the market is closed,
+    a price fetched after it closed stays fresh until it opens again, and the background refresh pauses.
+    """
+    def __init__(self, max_age:float=5, interval:float=2, timeout_limit:float=0.25, transport:Transport=None):
+        self.max_age = max_age
+        self.interval = interval
+        self.timeout_limit = timeout_limit
+        self.transport = transport
+        self._quotes = dict() # isin -> (price, seconds since epoch it was fetched at)
+        self._inflight = dict() # isin -> Future
+        self._subscribed = set()
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'refreshes': 0, 'errors': 0, 'served_age_total': 0.0, 'served_age_max': 0.0}
+        self._lock = Lock()
+        self._stop = Event()
+        self._refresher = None
+
+    def get(self, tradeable, max_age:float=None, transport:Transport=None):
+        """
+        Returns the price of a `Tradeable` or `isin`, fetching it only if the cached one is older than `max_age` seconds.
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        max_age = self.max_age if max_age is None else max_age
+
+        with self._lock:
+            quote = self._quotes.get(tradeable)
+            if quote and self._is_fresh(quote[1], max_age):
+                self._count_hit(unix_time() - quote[1])
+                return quote[0]
+            self._stats['misses'] += 1
+            future = self._inflight.get(tradeable)
+            owner = future is None
+            if owner: future = self._inflight[tradeable] = Future()
+            else: self._stats['coalesced'] += 1
+
+        if not owner: return future.result()
+        try:
+            price = Lemon.get_tradeable_cost(tradeable, timeout_limit=self.timeout_limit, transport=transport or self.transport)
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+                del self._inflight[tradeable]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._quotes[tradeable] = (price, unix_time())
+            del self._inflight[tradeable]
+        future.set_result(price)
+        return price
+
+    def get_many(self, tradeables, max_age:float=None, transport:Transport=None):
+        """
+        Returns the prices of many `Tradeables` or `isins`. Those missing or older than `max_age` seconds are fetched concurrently. \n
+        Returns a tuple of two dictionaries, `isin` to price and `isin` to the raised exception, like `Lemon.get_tradeable_costs`.
+        """
+        isins = list(OrderedDict.fromkeys(t.isin if isinstance(t, Tradeable) else t for t in tradeables))
+        max_age = self.max_age if max_age is None else max_age
+
+        prices, stale = dict(), list()
+        with self._lock:
+            for isin in isins:
+                quote = self._quotes.get(isin)
+                if quote and self._is_fresh(quote[1], max_age):
+                    self._count_hit(unix_time() - quote[1])
+                    prices[isin] = quote[0]
+                else: stale.append(isin)
+            self._stats['misses'] += len(stale)
+        if len(stale) <= 0: return prices, dict()
+
+        fetched, errors = Lemon.get_tradeable_costs(stale, timeout_limit=self.timeout_limit, transport=transport or self.transport)
+        now = unix_time()
+        with self._lock:
+            for isin, price in fetched.items(): self._quotes[isin] = (price, now)
+            self._stats['errors'] += len(errors)
+        prices.update(fetched)
+        return prices, errors
+
+    def peek(self, tradeable):
+        """
+        Returns the cached `(price, age in seconds)` of a `Tradeable` or `isin`, or `None` if it has none. Never makes a request.
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        quote = self._quotes.get(tradeable)
+        if quote is None: return None
+        return quote[0], unix_time() - quote[1]
+
+    def subscribe(self, tradeables):
+        """Adds `Tradeables` or `isins` to those refreshed in the background."""
+        with self._lock: self._subscribed.update(t.isin if isinstance(t, Tradeable) else t for t in tradeables)
+
+    def unsubscribe(self, tradeables):
+        """Removes `Tradeables` or `isins` from those refreshed in the background."""
+        with self._lock: self._subscribed.difference_update(t.isin if isinstance(t, Tradeable) else t for t in tradeables)
+
+    def refresh(self, tradeables=None):
+        """
+        Fetches the prices of `tradeables`, or of every subscribed instrument, concurrently. Returns the errors by `isin`.
+        """
+        if tradeables is None:
+            with self._lock: tradeables = list(self._subscribed)
+        prices, errors = Lemon.get_tradeable_costs(tradeables, timeout_limit=self.timeout_limit, transport=self.transport)
+        fetched = unix_time()
+        with self._lock:
+            for isin, price in prices.items(): self._quotes[isin] = (price, fetched)
+            self._stats['refreshes'] += 1
+            self._stats['errors'] += len(errors)
+        return errors
+
+    def start(self):
+        """
+        Refreshes the subscribed instruments every `interval` seconds in a background thread while the market is open, until `stop` is called.
+        """
+        if self._refresher is not None and self._refresher.is_alive(): return
+        self._stop.clear()
+
+        def refresh():
+            while not self._stop.is_set():
+                if not Lemon.is_market_open():
+                    # nothing changes until the market opens, so sleep until then
+                    self._stop.wait(max(self.interval, Lemon.next_market_opening().timestamp() - unix_time()))
+                    continue
+                try: self.refresh()
+                except requests.exceptions.RequestException: pass # retried on the next round
+                self._stop.wait(self.interval)
+
+        self._refresher = Thread(target=refresh, name='lemon-quotes', daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        """Stops the background refresh started by `start`."""
+        self._stop.set()
+
+    def get_stats(self):
+        """
+        Returns a dictionary of `hits`, `misses`, `coalesced` misses that shared another read's request, `refreshes`, `errors`,
+        and the `mean_age` and `max_age` in seconds of the prices served from cache.
+        """
+        with self._lock: stats = dict(self._stats)
+        stats['mean_age'] = stats.pop('served_age_total') / stats['hits'] if stats['hits'] else 0.0
+        stats['max_age'] = stats.pop('served_age_max')
+        return stats
+
+    def _count_hit(self, age):
+        self._stats['hits'] += 1
+        self._stats['served_age_total'] += age
+        self._stats['served_age_max'] = max(self._stats['served_age_max'], age)
+
+    @staticmethod
+    def _is_fresh(fetched, max_age):
+        now = unix_time()
+        if now - fetched <= max_age: return True
+        if max_age <= 0: return False
+        # a price fetched while the market was closed holds until it opens again
+        calendar = Lemon.calendar
+        return not calendar.is_open() and not calendar.is_open(datetime.fromtimestamp(fetched)) \
+            and calendar.next_opening(datetime.fromtimestamp(fetched)) == calendar.next_opening(datetime.fromtimestamp(now))
 
 class Lemon:
+    transport = Transport()
+    instruments = InstrumentCache()
+    calendar = TradingCalendar()
+    catalog = InstrumentCatalog()
+    quotes = QuoteCache()
+
     @staticmethod
-    def select_account(auth, name=''):
+    @_traced
+    def select_account(auth, name='', transport:Transport=None):
         """
         Selects an account beloning to the holder of the authentication provided.
         If no name is provided, it selects the first accound. Otherwise, it searches available accounts for the closest match.
+        `transport`: the `Transport` the account should use. `Lemon.transport` by default.
         """
-        assert Lemon.validate_key(auth), 'Endpoint not reachable. Check your credentials and connection.'
+        transport = transport or Lemon.transport
+        assert Lemon.validate_key(auth, transport=transport), 'Endpoint not reachable. Check your credentials and connection.'
         
-        accounts = requests.get('https://api.lemon.markets/rest/v1/accounts/', headers={'Authorization': auth}).json()['results']
+        accounts = transport.get('accounts/', headers={'Authorization': auth}).json()['results']
         
         if name:
             names = [a['name'] for a in accounts]
             index = names.index(_get_closest_string(name, names))
-            return Account(accounts[index]['uuid'], auth)
-        return Account(accounts[0]['uuid'], auth)
+            return Account(accounts[index]['uuid'], auth, transport=transport)
+        return Account(accounts[0]['uuid'], auth, transport=transport)
     
     @staticmethod
-    def is_market_open(timestamp:datetime=datetime.now()): # von https://www.ls-tc.de/de/handelszeiten
+    def is_market_open(timestamp:datetime=None): # von https://www.ls-tc.de/de/handelszeiten
         """
-        Returns if the market is open. Does not take holidays into account.
+        Returns if the market is open at the given `datetime`, or now if none is given. Takes holidays into account.
         """
-        timestamp = timestamp.astimezone(timezone('Europe/Berlin')) # The market is in the MEZ/MESZ timezone. So is Berlin.
-
-        if timestamp.date() in Germany(prov='NW', years=timestamp.year): return False # ignore holidays
-
-        time_calc = lambda h, m: time(hour=h,minute=m,tzinfo=timezone('Europe/Berlin'))
-        
-        if timestamp.weekday() == 5:
-            return time_calc(10,00) <= timestamp.time() <= time_calc(13,00)
-        elif timestamp.weekday() == 6:
-            return time_calc(17,00) <= timestamp.time() <= time_calc(19,00)
-        else:
-            return time_calc(7,30) <= timestamp.time() <= time_calc(23,00)
+        return Lemon.calendar.is_open(timestamp)
 
     @staticmethod
-    def next_market_availability(timestamp:datetime=datetime.now().astimezone()):
+    def next_market_availability(timestamp:datetime=None):
         """
         Returns the next market availability to the given `datetime` object,
         or the given `datetime` object if it is currently available.
         """
+        if timestamp is None: timestamp = datetime.now().astimezone()
         if Lemon.is_market_open(timestamp): return timestamp
         return Lemon.next_market_opening(timestamp=timestamp)
 
     @staticmethod
-    def next_market_opening(timestamp:datetime=datetime.now().astimezone()):
+    def next_market_opening(timestamp:datetime=None):
         """
-        Returns the next market opening time ahead of the given `datetime`.
+        Returns the next market opening time ahead of the given `datetime`, or of now if none is given.
         """
-        given_timezone = timestamp.astimezone().tzinfo # save now so we can convert back
-        timestamp = timestamp.astimezone(timezone('Europe/Berlin'))
-
-        time_calc = lambda h, m: time(hour=h,minute=m,tzinfo=timezone('Europe/Berlin'))
-        market_openings = [time_calc(7,30)] * 5 + [time_calc(10,00), time_calc(17,00)]
-
-        while timestamp in Germany(years=timestamp.year, prov='NW'): # ignore all holidays
-            timestamp += timedelta(days=1)
-
-        if timestamp.time() <= market_openings[timestamp.weekday()]:
-            next_opening = market_openings[timestamp.weekday()]
-        else:
-            next_opening = market_openings[(timestamp.weekday() + 1) % 7]
-        return timestamp.replace(hour=next_opening.hour, minute=next_opening.minute).astimezone(given_timezone)
+        return Lemon.calendar.next_opening(timestamp)
     
     @staticmethod
-    def next_market_closing(timestamp=datetime.now().astimezone()):
+    def next_market_closing(timestamp:datetime=None):
         """
-        Returns the next market closing time ahead of the given `datetime`
+        Returns the next market closing time ahead of the given `datetime`, or of now if none is given.
         """
-        given_timezone = timestamp.astimezone().tzinfo # save now so we can convert back
-        timestamp = timestamp.astimezone(timezone('Europe/Berlin'))
-
-        time_calc = lambda h, m: time(hour=h,minute=m,tzinfo=timezone('Europe/Berlin'))
-        market_closings = [time_calc(23,00)] * 5 + [time_calc(13,00), time_calc(19,00)]
-
-        while timestamp in Germany(years=timestamp.year, prov='NW'): # ignore all holidays
-            timestamp += timedelta(days=1)
-
-        if timestamp.time() <= market_closings[timestamp.weekday()]:
-            next_closing = market_closings[timestamp.weekday()]
-        else:
-            next_closing = market_closings[(timestamp.weekday() + 1) % 7]
-        return timestamp.replace(hour=next_closing.hour, minute=next_closing.minute).astimezone(given_timezone)
+        return Lemon.calendar.next_closing(timestamp)
 
     @staticmethod
-    def search_for_tradeable(query, search_for:str='all', search_type:str='all'):
+    @_traced
+    def search_for_tradeable(query, search_for:str='all', search_type:str='all', transport:Transport=None):
         """
         Searches for a `Tradeable` by query.\n
         `search_type`: What format the query matches. Can be `isin`, `wkn`, `title`/`name`, `type`, and `symbol`. If none is given, symbol will not be searched for.\n
@@ -106,46 +1276,49 @@ class Lemon:
         Returns `None` if tradeable is not found.
         """
         if len(query) <= 0: return None
+        transport = transport or Lemon.transport
 
-        # normalize sarch_for and search_type
-        if 'stock' in search_for.lower(): search_for = 'stocks'
-        elif 'bond' in search_for.lower(): search_for = 'bonds'
-        elif 'fond' in search_for.lower(): search_for = 'fonds'
-        elif 'warrant' in search_for.lower(): search_for = 'warrants'
-        else: search_for = None
-
-        if 'isin' in search_type.lower(): search_type = 'isin'
-        elif 'wkn' in search_type.lower(): search_type = 'wkn'
-        elif 'title' in search_type.lower(): search_type = 'title'
-        elif 'name' in search_type.lower(): search_type = 'title'
-        elif 'type' in search_type.lower(): search_type = 'type'
-        elif 'symbol' in search_type.lower(): search_type = 'symbol'
-        else: search_type = None
-
-        instruments = list()
-        
-        next_page = 'https://api.lemon.markets/rest/v1/data/instruments/?search={0}'.format(query)
-        if search_type != None and 'symbol' in search_type: next_page = 'https://api.lemon.markets/rest/v1/data/instruments/?search={0}'.format(query[0])
-        while next_page:
-            search = requests.get(next_page)
-            search.raise_for_status(); search = search.json()
-            if search['count'] >= 1: instruments.extend(search['results'])
-            next_page = search['next']
-        
+        search_for, search_type = _normalize_search(search_for, search_type)
+
+        # answer from the local catalog where it has a close enough match, otherwise ask the API
+        found = _search_catalog(query, search_for, search_type)
+        if found: return Tradeable(found['isin'], transport=transport, details=found)
+
+        # without a search_type the first match is all we need, so only prefetch if pages could be filtered out
+        instruments = Lemon.iter_instruments(query[0] if search_type == 'symbol' else query, types=search_for, prefetch=bool(search_type or search_for), transport=transport)
+        if not search_type:
+            instrument = next(instruments, None)
+            instruments.close()
+            if instrument is None: return None
+            return Tradeable(instrument['isin'], transport=transport)
+
+        instruments = list(instruments)
         if len(instruments) <= 0: return None
-        if search_for: instruments = list(filter(lambda x: x['type'].lower() in search_for, instruments))
-        if not search_type: return Tradeable(instruments[0]['isin'])
         
         instr_names = [x[search_type] for x in instruments]
         try:
             to_search = _get_closest_string(query, instr_names, length_dependant=False)
             indx = instr_names.index(to_search)
-            return Tradeable(instruments[indx]['isin'])
+            return Tradeable(instruments[indx]['isin'], transport=transport)
         except (IndexError, ValueError):
             return None
         return None
 
     @staticmethod
+    def iter_instruments(query:str, types:str=None, prefetch:bool=True, transport:Transport=None):
+        """
+        Yields every instrument matching `query` as a dictionary, as the result pages arrive. \n
+        `types`: only yields instruments whose `type` is contained in this string, such as `stocks`. \n
+        `prefetch`: requests the next page in the background while the current one is consumed. \n
+        Stop iterating, or `close` the generator, to skip the remaining pages.
+        """
+        for page in _iter_pages(transport or Lemon.transport, 'data/instruments/', params={'search': query}, prefetch=prefetch):
+            for instrument in page['results']:
+                if types and instrument['type'].lower() not in types: continue
+                yield instrument
+
+    @staticmethod
+    @_traced
     def nyse_symbol_to_name(symbol:str):
         """
         Converts a NYSE symbol to a company name. Returns `None` if no company is found.\n
@@ -154,7 +1327,7 @@ class Lemon:
         # Credit to https://stackoverflow.com/questions/38967533/retrieve-company-name-with-ticker-symbol-input-yahoo-or-google-api
         url = "http://d.yimg.com/autoc.finance.yahoo.com/autoc?query={0}&lang=en".format(symbol)
 
-        results = requests.get(url)
+        results = Lemon.transport.get(url)
         results.raise_for_status(); results = results.json()
 
         for res in results['ResultSet']['Result']:
@@ -162,91 +1335,161 @@ class Lemon:
                 return res['name']
 
     @staticmethod
-    def get_tradeable_cost(tradeable, timeout_limit=0.25):
+    @_traced
+    def get_tradeable_cost(tradeable, timeout_limit=0.25, transport:Transport=None):
         """
         Returns the last recorded price of a `Tradeable`
         """
         if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
-        if timeout_limit > 0 and Lemon.is_market_open():
+        return Lemon._fetch_tradeable_cost(tradeable, timeout_limit > 0 and Lemon.is_market_open(), timeout_limit, transport or Lemon.transport)
+
+    @staticmethod
+    @_traced
+    def get_tradeable_costs(tradeables, timeout_limit=0.25, max_workers:int=16, transport:Transport=None):
+        """
+        Returns the last recorded prices of many `Tradeables` or `isins`, fetched concurrently. \n
+        `max_workers`: how many requests may be in flight at once. Should not exceed the `pool_maxsize` of the transport. \n
+        Returns a tuple of two dictionaries: `isin` to price for every successful lookup, and `isin` to the raised exception for every failed one.
+        """
+        transport = transport or Lemon.transport
+        isins = list(OrderedDict.fromkeys(t.isin if isinstance(t, Tradeable) else t for t in tradeables))
+        use_ticks = timeout_limit > 0 and Lemon.is_market_open()
+
+        prices, errors = dict(), dict()
+        if len(isins) <= 0: return prices, errors
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(isins)))) as pool:
+            futures = {isin: _submit(pool, Lemon._fetch_tradeable_cost, isin, use_ticks, timeout_limit, transport) for isin in isins}
+            for isin, future in futures.items():
+                try: prices[isin] = future.result()
+                except Exception as e: errors[isin] = e
+        return prices, errors
+
+    @staticmethod
+    def _fetch_tradeable_cost(isin, use_ticks, timeout_limit, transport):
+        if use_ticks:
             try:
-                ticker = requests.get('https://api.lemon.markets/rest/v1/data/instruments/{0}/ticks/latest/'.format(tradeable),timeout=timeout_limit)
+                ticker = transport.get('data/instruments/{0}/ticks/latest/'.format(isin), timeout=timeout_limit, retries=0)
                 ticker.raise_for_status(); ticker = ticker.json()
                 if ticker['price'] > 0: return ticker['price']
             except (requests.exceptions.ReadTimeout, TimeoutError, KeyError):
                 pass
-        ticker = requests.get('https://api.lemon.markets/rest/v1/data/instruments/{0}/candle/m1/latest'.format(tradeable))
+        ticker = transport.get('data/instruments/{0}/candle/m1/latest'.format(isin))
         ticker.raise_for_status(); ticker = ticker.json()
         return ticker['close']
     
     @staticmethod
-    def validate_key(auth):
-        """Checks if the authentication given is valid. Wastes an API call."""
+    @_traced
+    def validate_key(auth, transport:Transport=None, use_cache:bool=True):
+        """
+        Checks if the authentication given is valid. Wastes an API call, unless the key was already validated within the `ttl` of the transport's `CredentialCache`.
+        `use_cache`: set to `False` to always ask the API.
+        """
+        transport = transport or Lemon.transport
+        if use_cache and transport.credentials.is_valid(auth): return True
         
         try:
-            req = requests.get('https://api.lemon.markets/rest/v1/accounts/', headers={'Authorization': auth})
+            req = transport.get('accounts/', headers={'Authorization': auth})
             req.raise_for_status(); req = req.json()
-            return 'results' in str(req)
+            if 'results' not in str(req): return False
+            transport.credentials.add(auth)
+            return True
         except (TimeoutError, ValueError): return False
 
 class Tradeable:
-    def __init__(self, isin):
+    def __init__(self, isin, transport:Transport=None, details:dict=None):
         self.isin = isin
+        self.transport = transport or Lemon.transport
 
-        # Grab the name, type, and wkin
-        details = self.get_details()
-        
-        self.wkin = details['wkn']
-        self.name = details['name']
-        self.type = details['type']
-        self.symbol = details['symbol']
+        # The name, type, and wkin are only looked up once they are needed, and not at all if given
+        self._details = None
+        self._given = dict(details or {})
+        if details and all(field in details for field in InstrumentCache.REQUIRED_FIELDS):
+            # only written if new or changed, as putting commits to disk when the cache is persisted
+            if Lemon.instruments.peek(isin) != details: Lemon.instruments.put(isin, details)
+            self._details = dict(details)
+
+    @property
+    def wkin(self): return self._get_detail('wkn')
+
+    @property
+    def name(self): return self._get_detail('name')
+
+    @property
+    def type(self): return self._get_detail('type')
+
+    @property
+    def symbol(self): return self._get_detail('symbol')
     
     def get_cost(self):
         """
         Returns the last recorded cost for this `Tradeable`.
         An alias for `Lemon.get_tradeable_cost`.
         """
-        return Lemon.get_tradeable_cost(self)
+        return Lemon.get_tradeable_cost(self, transport=self.transport)
     
     def get_details(self):
         """
-        Returns a dictionary containing this `tradeable`'s `isin`, `wkn`, `name`, `type`, and `symbol` 
+        Returns a dictionary containing this `tradeable`'s `isin`, `wkn`, `name`, `type`, and `symbol`.
+        Served from `Lemon.instruments` where possible.
         """
-        req = requests.get('https://api.lemon.markets/rest/v1/data/instruments/{0}/'.format(self.isin))
-        req.raise_for_status(); req = req.json()
-        req['name'] = req['title']; del req['title']
-        return req
+        return Lemon.instruments.get(self.isin, transport=self.transport)
+
+    def _get_detail(self, field):
+        if self._details is None and field in self._given: return self._given[field]
+        return self._get_cached_details()[field]
+
+    def _get_cached_details(self):
+        if self._details is None: self._details = self.get_details()
+        return self._details
         
 
 class Account:
-    def __init__(self, uuid, auth_key):
+    def __init__(self, uuid, auth_key, transport:Transport=None):
         self.uuid = uuid
         self.auth = auth_key
+        self.transport = transport or Lemon.transport
     
+    @_traced
     def get_funds(self):
         """
         Gets the available, investible funds of this account.
         """
-        assert Lemon.validate_key(self.auth), 'Authorization invalid. Check your credentials and connection.'
+        assert Lemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
         
-        req = requests.get('https://api.lemon.markets/rest/v1/accounts/{0}/state/'.format(self.uuid), headers={'Authorization': self.auth})
+        req = self.transport.get('accounts/{0}/state/'.format(self.uuid), headers={'Authorization': self.auth})
         req.raise_for_status(); req = req.json()
         return req['cash_to_invest']
 
+    @_traced
     def get_value(self):
-        value = 0
-        for tradeable in self.get_held_tradeables():
-            value += tradeable.get_cost()*tradeable.get_amount()
-        return value + self.get_funds()
+        """
+        Returns the investible funds plus the current value of everything held. Values a single `Portfolio` snapshot.
+        """
+        return self.get_portfolio().get_value()
 
+    @_traced
+    def get_portfolio(self):
+        """
+        Returns a `Portfolio` snapshot of everything held and the investible funds of this account.
+        """
+        assert Lemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
+
+        held = self.transport.get('accounts/{0}/portfolio/aggregated'.format(self.uuid), headers={'Authorization': self.auth})
+        held.raise_for_status(); held = held.json()
+        state = self.transport.get('accounts/{0}/state/'.format(self.uuid), headers={'Authorization': self.auth})
+        state.raise_for_status(); state = state.json()
+        return Portfolio(self, held, state['cash_to_invest'])
+
+    @_traced
     def get_held_tradeables(self):
         """
         Returns a list of all Tradeables currently held.
         """
-        assert Lemon.validate_key(self.auth), 'Authorization invalid. Check your credentials and connection.'
+        assert Lemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
         
-        held = requests.get('https://api.lemon.markets/rest/v1/accounts/{0}/portfolio/aggregated'.format(self.uuid), headers={'Authorization': self.auth})
+        held = self.transport.get('accounts/{0}/portfolio/aggregated'.format(self.uuid), headers={'Authorization': self.auth})
         held.raise_for_status(); held = held.json()
-        return [HeldTradeable(x['instrument']['isin'], self) for x in held]
+        return [HeldTradeable(x['instrument']['isin'], self, details=x['instrument']) for x in held]
     
     def get_held_tradeable(self, tradeable:str or Tradeable):
         """
@@ -255,6 +1498,7 @@ class Account:
         if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
         return HeldTradeable(tradeable, self)
     
+    @_traced
     def get_held_count(self, tradeable:str or Tradeable):
         """
         Returns an integer representing how many of a `Tradeable` or `isin` you hold
@@ -262,25 +1506,37 @@ class Account:
         if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
         return HeldTradeable(tradeable, self).get_amount()
         
+    @_traced
     def get_orders(self, ignore_executed:bool= True):
         """
         Returns a list of `Orders`.
         If `ignore_executed` is `True`, it returns a list of `Orders` that have not been executed yet
         """
-        assert Lemon.validate_key(self.auth), 'Authorization invalid. Check your credentials and connection.'
+        return list(self.iter_orders(ignore_executed=ignore_executed))
 
-        orders = list()
-        page = 'https://api.lemon.markets/rest/v1/accounts/{0}/orders/'.format(self.uuid)
-        while page:
-            response = requests.get(page, headers={'Authorization': self.auth})
-            response.raise_for_status(); response = response.json()
-            page = response['next']
-            
-            filtered_orders = filter(lambda x: 'executed' not in str(x['status']).lower() or not ignore_executed, response['results'])
-            orders.extend(list(map(lambda x: Order(x['uuid'], self), filtered_orders)))
-        return orders
+    def iter_orders(self, ignore_executed:bool=None, status:str=None, side:str=None, created_from:datetime=None, created_until:datetime=None, prefetch:bool=True):
+        """
+        Yields `Orders` as their result pages arrive, each holding the payload it was listed with. \n
+        If `ignore_executed` is `True`, executed `Orders` are skipped. Defaults to `True` unless a `status` is given. \n
+        `status`, `side`, `created_from`, `created_until`: filters applied by the API, so filtered out orders are never downloaded. \n
+        `prefetch`: requests the next page in the background while the current one is consumed. \n
+        Stop iterating, or `close` the generator, to skip the remaining pages.
+        """
+        assert Lemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
+
+        params = {'status': status, 'side': side}
+        if created_from: params['created_at_from'] = created_from.timestamp()
+        if created_until: params['created_at_until'] = created_until.timestamp()
+        params = {key: value for key, value in params.items() if value is not None}
+        if ignore_executed is None: ignore_executed = status is None
+
+        for page in _iter_pages(self.transport, 'accounts/{0}/orders/'.format(self.uuid), params=params, prefetch=prefetch, headers={'Authorization': self.auth}):
+            for order in page['results']:
+                if ignore_executed and 'executed' in str(order['status']).lower(): continue
+                yield Order(order['uuid'], self, data=order)
     
-    def create_order(self, tradeable:Tradeable or str, quantity:int=1, buy:bool=False, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False):
+    @_traced
+    def create_order(self, tradeable:Tradeable or str, quantity:int=1, buy:bool=False, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False, max_quote_age:float=None, portfolio=None):
         """
         Creates an order on the stock market. \n
         `tradeable`: the Tradeable to order \n
@@ -290,51 +1546,81 @@ class Account:
         `limits`: A tuple representing the (`stop limit`, `limit`) of the order. `(None, None)` by default. Set either to `None` to disable it. Overrides `slippage`. \n
         `length`: A `timedelta` or `int` representing how long the order should remain valid. `16 hours` by default. \n
         `handle_errors`: A boolean. If true, errors such as quantity too high or too low will be handled, otherwise, they will be raised. \n
+        `max_quote_age`: how many seconds old the price from `Lemon.quotes` may be. Defaults to the quote cache's `max_age`. Set to `0` to always fetch a fresh one. \n
+        `portfolio`: a `Portfolio` snapshot to check the held quantity or funds against, instead of requesting them. \n
         Returns an `Order` representing the created order.
         """
         if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
-        request_args = {'instrument': tradeable, 'quantity': quantity}
+        price = Lemon.quotes.get(tradeable, max_age=max_quote_age, transport=self.transport)
 
-        if isinstance(length, timedelta):
-            request_args['valid_until'] = ((datetime.utcnow() + length).astimezone(timezone('UTC')) - datetime(1970,1,1, tzinfo=timezone('UTC'))).total_seconds()
-        else:
-             request_args['valid_until'] = ((datetime.utcnow() + timedelta(seconds=length)).astimezone(timezone('UTC')) - datetime(1970,1,1, tzinfo=timezone('UTC'))).total_seconds()
-        
-        # Set side and calculate limit based on slippage
-        if buy:
-            request_args['side'] = 'buy'
-            slippage_price = (1+slippage) * Lemon.get_tradeable_cost(tradeable)
-        else:
-            request_args['side'] = 'sell'
-            slippage_price = (1-slippage) * Lemon.get_tradeable_cost(tradeable)
+        # one request for whatever the order is checked against, unless a snapshot was given
+        if portfolio is not None: available = portfolio.funds if buy else portfolio.get_amount(tradeable)
+        else: available = self.get_funds() if buy else self.get_held_count(tradeable)
 
-            # double-check sell quantity
-            if quantity > self.get_held_count(tradeable):
-                if handle_errors: quantity = min(quantity, self.get_held_count(tradeable))
-                else: raise ValueError('You cannot sell more than you hold')
-        
-        if quantity <= 0: 
-            if handle_errors: return None
-            else: raise ValueError('Quantity must be greater than 0!')
-        
-        if slippage > 0: request_args['limit_price'] = slippage_price
-        
-        # override for manually-set limits
-        if limits:
-            limits = sorted(limits)
-            if limits[0]:
-                request_args['stop_limit'] = limits[0]
-            if limits[1]:
-                request_args['limit_price'] = limits[1]
-        
-        # double-check buy quantity
-        if buy and quantity * request_args['limit_price'] > self.get_funds(): 
-            if handle_errors: quantity = int(self.get_funds()/request_args['limit_price'])
-            else: raise ValueError('Price limit is greater than investable funds!')
-        
-        order = requests.post('https://api.lemon.markets/rest/v1/accounts/{0}/orders/'.format(self.uuid), data=request_args, headers={'Authorization': self.auth})
+        request_args = _prepare_order(tradeable, quantity, buy, price, available, slippage, limits, length, handle_errors)
+        if request_args is None: return None
+        return self._submit_order(request_args)
+
+    @_traced
+    def create_orders(self, trades:list, slippage:float=0.01, length=timedelta(hours=16), handle_errors:bool=False, max_quote_age:float=None, max_workers:int=8):
+        """
+        Creates many orders at once, such as when rebalancing. \n
+        `trades`: a list of `(tradeable, quantity, buy)` tuples, or of dictionaries taking the `tradeable`, `quantity`, `buy`, `slippage`, `limits`,
+        `length`, `handle_errors` and `max_quote_age` arguments of `Account.create_order`. Any other key raises a `ValueError`. \n
+        `slippage`, `length`, `handle_errors`, `max_quote_age`: defaults for trades that do not set their own. \n
+        `max_workers`: how many orders may be submitted at once. \n
+        Funds and holdings are taken from one `Portfolio` snapshot and prices from `Lemon.quotes`, all checked before anything is submitted.
+        Every buy reduces the funds left for the buys after it, and every sell the quantity left to sell.
+        A failed check raises, unless the trade's `handle_errors` drops it. \n
+        Returns a tuple of a list of `Orders` in the order of `trades`, with `None` for every trade not placed,
+        and a dictionary of the index in `trades` to the raised exception for every trade whose price or submission failed.
+        A failed submission never discards the orders already placed.
+        """
+        defaults = {'quantity': 1, 'buy': False, 'slippage': slippage, 'limits': (False, False), 'length': length, 'handle_errors': handle_errors, 'max_quote_age': max_quote_age}
+        trades = [dict(defaults, **(trade if isinstance(trade, dict) else dict(zip(('tradeable', 'quantity', 'buy'), trade)))) for trade in trades]
+        for trade in trades:
+            unsupported = set(trade) - set(defaults) - {'tradeable'}
+            if unsupported: raise ValueError('Unsupported trade arguments: {0}'.format(', '.join(sorted(unsupported))))
+            if isinstance(trade['tradeable'], Tradeable): trade['tradeable'] = trade['tradeable'].isin
+
+        # one lookup per distinct max_quote_age, so a trade asking for a fresh price gets one
+        portfolio = self.get_portfolio()
+        isins_by_age = OrderedDict()
+        for trade in trades: isins_by_age.setdefault(trade['max_quote_age'], list()).append(trade['tradeable'])
+        quotes = {age: Lemon.quotes.get_many(isins, max_age=age, transport=self.transport) for age, isins in isins_by_age.items()}
+
+        # check every trade against what the trades before it leave over
+        funds, held = portfolio.funds, {isin: portfolio.get_amount(isin) for isin in portfolio.positions}
+        prepared, errors = list(), dict()
+        for index, trade in enumerate(trades):
+            isin, buy = trade['tradeable'], trade['buy']
+            prices, price_errors = quotes[trade['max_quote_age']]
+            if isin in price_errors:
+                if not trade['handle_errors']: raise price_errors[isin]
+                errors[index] = price_errors[isin]
+                prepared.append(None)
+                continue
+            request_args = _prepare_order(isin, trade['quantity'], buy, prices[isin], funds if buy else held.get(isin, 0),
+                                               trade['slippage'], trade['limits'], trade['length'], trade['handle_errors'])
+            if request_args is not None:
+                if buy: funds -= request_args['quantity'] * request_args.get('limit_price', prices[isin])
+                else: held[isin] = held.get(isin, 0) - request_args['quantity']
+            prepared.append(request_args)
+
+        orders = [None] * len(prepared)
+        submittable = [index for index, request_args in enumerate(prepared) if request_args is not None]
+        if len(submittable) <= 0: return orders, errors
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(submittable)))) as pool:
+            futures = {index: _submit(pool, self._submit_order, prepared[index]) for index in submittable}
+            for index, future in futures.items():
+                try: orders[index] = future.result()
+                except Exception as e: errors[index] = e
+        return orders, errors
+
+    def _submit_order(self, request_args):
+        order = self.transport.post('accounts/{0}/orders/'.format(self.uuid), data=request_args, headers={'Authorization': self.auth})
         order.raise_for_status(); order = order.json()
-        return Order(order['uuid'], self)
+        return Order(order['uuid'], self, data=order)
     
     def create_buy_order(self, tradeable:Tradeable, quantity:int=1, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False):
         """
@@ -367,45 +1653,77 @@ class Account:
 
 
 class Order:
-    def __init__(self, uuid, account:Account):
+    def __init__(self, uuid, account:Account, data:dict=None):
         if not isinstance(account, Account): raise ValueError('Account provided is not a valid account')
         self.uuid = uuid
         self.account = account
+        self.data = data # the payload this order was last seen with, if any
+
+    @property
+    def status(self):
+        """The status this order was last seen with, or `None` if it was never loaded."""
+        return self.data.get('status') if self.data else None
+
+    @property
+    def quantity(self):
+        """The quantity this order was last seen with, or `None` if it was never loaded."""
+        return self.data.get('quantity') if self.data else None
+
+    @property
+    def average_price(self):
+        """The average price this order was last seen executing with, or `-1` if it is pending or was never loaded."""
+        if not self.data or self.is_pending(): return -1
+        return self.data.get('average_price', -1)
+
+    def is_pending(self):
+        """Returns `True` if this order was last seen open, or was never loaded."""
+        return self.status is None or 'open' in self.status
+
+    @_traced
+    def refresh(self):
+        """
+        Reloads this order's payload from the API and returns it.
+        """
+        assert Lemon.validate_key(self.account.auth, transport=self.account.transport), 'Authorization invalid. Check your credentials and connection.'
+        order = self.account.transport.get('accounts/{0}/orders/{1}/'.format(self.account.uuid,self.uuid), headers={'Authorization': self.account.auth})
+        order.raise_for_status(); self.data = order.json()
+        return self.data
     
+    @_traced
     def delete(self):
         """
         Deletes this order. Returns `True` if successful, `False` otherwise.
         """
-        assert Lemon.validate_key(self.account.auth), 'Authorization invalid. Check your credentials and connection.'
-        deleted = requests.delete('https://api.lemon.markets/rest/v1/accounts/{0}/orders/{1}/'.format(self.account.uuid,self.uuid), headers={'Authorization': self.account.auth})
+        assert Lemon.validate_key(self.account.auth, transport=self.account.transport), 'Authorization invalid. Check your credentials and connection.'
+        deleted = self.account.transport.delete('accounts/{0}/orders/{1}/'.format(self.account.uuid,self.uuid), headers={'Authorization': self.account.auth})
         deleted.raise_for_status()
         return deleted.status_code == 204
     
+    @_traced
     def get_status(self):
         """
         Gets a `tuple` representing the status of the order.
         The first value is the status as a string, the second is the amount it executed with, or `-1` if still pending.
         """
-        
-        assert Lemon.validate_key(self.account.auth), 'Authorization invalid. Check your credentials and connection.'
-        order = requests.get('https://api.lemon.markets/rest/v1/accounts/{0}/orders/{1}/'.format(self.account.uuid,self.uuid), headers={'Authorization': self.account.auth})
-        order.raise_for_status(); order = order.json()
+        order = self.refresh()
 
         if 'open' in order['status']: return (order['status'], -1)
         return order['status'], order['average_price']
 
 class HeldTradeable(Tradeable):
-    def __init__(self, isin, account:Account):
+    def __init__(self, isin, account:Account, details:dict=None):
         if not isinstance(account, Account): raise ValueError('Account provided is not a valid account')
         self.isin = isin
         self.account = account
-        super().__init__(isin)
+        # portfolio payloads name the instrument by its title
+        if details and 'name' not in details and 'title' in details: details = dict(details, name=details['title'])
+        super().__init__(isin, transport=account.transport, details=details)
     
     def get_amount(self):
         """
         Returns how many of this `Tradeable` you hold.
         """
-        held_tradeable = requests.get('https://api.lemon.markets/rest/v1/accounts/{0}/portfolio/{1}/aggregated/'.format(self.account.uuid, self.isin), headers={'Authorization': self.account.auth})
+        held_tradeable = self.account.transport.get('accounts/{0}/portfolio/{1}/aggregated/'.format(self.account.uuid, self.isin), headers={'Authorization': self.account.auth})
         held_tradeable.raise_for_status(); held_tradeable = held_tradeable.json()
 
         if len(held_tradeable) <= 0: return 0
@@ -415,7 +1733,7 @@ class HeldTradeable(Tradeable):
         """
         Returns the average cost of acquiring this `Tradeable`, or `-1` if you do not hold any.
         """
-        held_tradeable = requests.get('https://api.lemon.markets/rest/v1/accounts/{0}/portfolio/{1}/aggregated/'.format(self.account.uuid, self.isin), headers={'Authorization': self.account.auth})
+        held_tradeable = self.account.transport.get('accounts/{0}/portfolio/{1}/aggregated/'.format(self.account.uuid, self.isin), headers={'Authorization': self.account.auth})
         held_tradeable.raise_for_status(); held_tradeable = held_tradeable.json()
         
         if len(held_tradeable) <= 0: return -1
@@ -443,4 +1761,303 @@ class HeldTradeable(Tradeable):
         `handle_errors`: A boolean. If true, errors such as quantity too high or too low will be handled, otherwise, they will be raised. \n
         Returns an `Order` representing the created order.
         """
-        return self.account.create_sell_order(self, quantity=quantity, slippage=slippage, limits=limits, length=length)
\ No newline at end of file
+        return self.account.create_sell_order(self, quantity=quantity, slippage=slippage, limits=limits, length=length)
+
+class Portfolio:
+    """
+    A snapshot of everything an `Account` holds and its investible funds, built from one `portfolio/aggregated` and one `state` response.
+    Nothing on it changes after it was taken; call `Account.get_portfolio` again for fresh values.
+    """
+    def __init__(self, account:Account, positions:list, funds:float):
+        if not isinstance(account, Account): raise ValueError('Account provided is not a valid account')
+        self.account = account
+        self.funds = funds
+        self.timestamp = datetime.now().astimezone()
+        self.positions = OrderedDict((x['instrument']['isin'], x) for x in positions)
+
+    def get_tradeables(self):
+        """
+        Returns a list of all `HeldTradeables` in this snapshot. Their details are taken from the snapshot where it contains them.
+        """
+        return [HeldTradeable(isin, self.account, details=x['instrument']) for isin, x in self.positions.items()]
+
+    def get_amount(self, tradeable:str or Tradeable):
+        """
+        Returns how many of a `Tradeable` or `isin` were held, or `0` if it was not held.
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        if tradeable not in self.positions: return 0
+        return self.positions[tradeable]['quantity']
+
+    def get_acquired_cost(self, tradeable:str or Tradeable):
+        """
+        Returns the average cost of acquiring a `Tradeable` or `isin`, or `-1` if it was not held.
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        if tradeable not in self.positions: return -1
+        return self.positions[tradeable]['average_price']
+
+    def get_value(self, prices:dict=None):
+        """
+        Returns the investible funds plus the value of every position. \n
+        `prices`: an optional mapping of `isin` to price. Positions missing from it are priced concurrently with `Lemon.get_tradeable_costs`.
+        """
+        prices = dict(prices or dict())
+        missing = [isin for isin in self.positions if isin not in prices]
+        if missing:
+            fetched, errors = Lemon.get_tradeable_costs(missing, transport=self.account.transport)
+            if errors: raise next(iter(errors.values()))
+            prices.update(fetched)
+        return self.funds + sum(prices[isin] * position['quantity'] for isin, position in self.positions.items())
+
+    def __iter__(self):
+        return iter(self.get_tradeables())
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, tradeable):
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        return tradeable in self.positions
+
+class OrderTracker:
+    """
+    Follows many `Orders` of one `Account` until they are no longer open.
+    Every poll refreshes all of them with a single paged `orders` listing, instead of one request per order. \n
+    `min_interval`, `max_interval`: seconds between polls. While nothing changes, polls back off from `min_interval` towards `max_interval`;
+    as soon as an order changes, they return to `min_interval`.
+    """
+    def __init__(self, account:Account, min_interval:float=1, max_interval:float=30):
+        if not isinstance(account, Account): raise ValueError('Account provided is not a valid account')
+        self.account = account
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._orders = dict() # uuid -> Order
+        self._futures = dict() # uuid -> Future
+        self._lock = Lock()
+        self._stop = Event()
+        self._poller = None
+
+    def track(self, order:Order, callback=None):
+        """
+        Starts tracking an `Order`. Returns a `Future` that resolves to the `Order` once it is no longer open. \n
+        `callback`: called with the `Order` once it is no longer open.
+        """
+        if order.account is not self.account and order.account.uuid != self.account.uuid: raise ValueError('Order does not belong to the tracked account')
+        with self._lock:
+            if order.uuid not in self._futures:
+                self._orders[order.uuid] = order
+                self._futures[order.uuid] = Future()
+            future = self._futures[order.uuid]
+        if callback:
+            def resolved(f):
+                if not f.cancelled(): callback(f.result()) # untrack cancels the future, there is no order to pass on
+            future.add_done_callback(resolved)
+        if order.data and not order.is_pending(): self._finish(order)
+        return future
+
+    def untrack(self, order:Order):
+        """Stops tracking an `Order`. Its `Future` is cancelled if it has not resolved yet."""
+        with self._lock:
+            self._orders.pop(order.uuid, None)
+            future = self._futures.pop(order.uuid, None)
+        if future: future.cancel()
+
+    def refresh(self):
+        """
+        Refreshes every tracked order with one listing, and resolves the `Futures` of those no longer open.
+        Orders missing from the listing are loaded one by one. Returns how many orders changed.
+        """
+        with self._lock: pending = dict(self._orders)
+        if len(pending) <= 0: return 0
+
+        changed = 0
+        orders = self.account.iter_orders(ignore_executed=False, prefetch=False) # a prefetched page would be wasted on stopping early
+        try:
+            for listed in orders:
+                order = pending.pop(listed.uuid, None)
+                if order is None: continue
+                if order.data != listed.data: changed += 1
+                order.data = listed.data
+                if not order.is_pending(): self._finish(order)
+                if len(pending) <= 0: break # stop paging once every tracked order was seen
+        finally:
+            orders.close()
+
+        for order in pending.values():
+            status = order.status
+            order.refresh()
+            if order.status != status: changed += 1
+            if not order.is_pending(): self._finish(order)
+        return changed
+
+    def start(self):
+        """
+        Polls in a background thread until `stop` is called, adapting the interval to how often orders change.
+        """
+        if self._poller is not None and self._poller.is_alive(): return
+        self._stop.clear()
+
+        def poll():
+            while not self._stop.is_set():
+                try: changed = self.refresh()
+                except (requests.exceptions.RequestException, AssertionError, ValueError, KeyError): changed = 0 # retried on the next poll
+                self._adapt(changed)
+                self._stop.wait(self.interval)
+
+        self._poller = Thread(target=poll, name='lemon-order-tracker', daemon=True)
+        self._poller.start()
+
+    def stop(self):
+        """Stops the background polling started by `start`."""
+        self._stop.set()
+
+    def wait(self, orders:list=None, timeout:float=None, return_when=ALL_COMPLETED):
+        """
+        Waits for `orders`, or every tracked order, to no longer be open. Untracked orders are tracked first. \n
+        `return_when`: as for `concurrent.futures.wait`, such as `FIRST_COMPLETED`. \n
+        Polls in the calling thread unless `start` was called. Returns the `(done, not_done)` sets of `Futures`.
+        """
+        if orders is None:
+            with self._lock: futures = list(self._futures.values())
+        else: futures = [self.track(order) for order in orders]
+
+        if self._poller is not None and self._poller.is_alive(): return wait(futures, timeout=timeout, return_when=return_when)
+
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            self._adapt(self.refresh())
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0: return wait(futures, timeout=0, return_when=return_when)
+            done, not_done = wait(futures, timeout=min(self.interval, remaining) if remaining is not None else self.interval, return_when=return_when)
+            if return_when == ALL_COMPLETED and not not_done: return done, not_done
+            if return_when != ALL_COMPLETED and done: return done, not_done
+
+    def __len__(self):
+        return len(self._orders)
+
+    def _adapt(self, changed):
+        if changed > 0: self.interval = self.min_interval
+        else: self.interval = min(self.interval * 2, self.max_interval)
+
+    def _finish(self, order):
+        with self._lock:
+            self._orders.pop(order.uuid, None)
+            future = self._futures.pop(order.uuid, None)
+        if future and not future.done(): future.set_result(order)
+
+class CandleStore:
+    """
+    Stores the candle history of instruments on disk, one file per column, so it can be read as memory-mapped `numpy` arrays
+    without loading whole histories into Python objects. Requires `numpy`. \n
+    `path`: the directory to store histories in. \n
+    `resolution`: the candle resolution, such as `m1`, `h1` or `d1`. \n
+    Every column holds little-endian float64s; `t` holds the start of each candle in seconds since epoch, in ascending order.
+    """
+    COLUMNS = ('t', 'open', 'high', 'low', 'close', 'volume')
+    RESOLUTIONS = {'m1': 60, 'h1': 3600, 'd1': 86400} # seconds per candle
+
+    def __init__(self, path:str, resolution:str='m1'):
+        if resolution not in self.RESOLUTIONS: raise ValueError('Resolution must be one of {0}'.format(', '.join(self.RESOLUTIONS)))
+        self.path = os.path.join(os.path.expanduser(path), resolution)
+        self.resolution = resolution
+
+    def get(self, tradeable, start:datetime=None, end:datetime=None):
+        """
+        Returns the stored history of a `Tradeable` or `isin` as a dictionary of column name to read-only, memory-mapped array.
+        `start` and `end` narrow it to the candles starting within them; the arrays are then views, not copies.
+        """
+        import numpy as np
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        directory = self._get_directory(tradeable)
+        rows = self._count_rows(directory)
+        if rows <= 0: return {column: np.zeros(0) for column in self.COLUMNS}
+
+        history = {column: np.memmap(os.path.join(directory, column), dtype='<f8', mode='r', shape=(rows,)) for column in self.COLUMNS}
+        first = 0 if start is None else np.searchsorted(history['t'], start.timestamp(), side='left')
+        last = rows if end is None else np.searchsorted(history['t'], end.timestamp(), side='right')
+        return {column: values[first:last] for column, values in history.items()}
+
+    def get_last_timestamp(self, tradeable):
+        """
+        Returns the start of the newest stored candle of a `Tradeable` or `isin` in seconds since epoch, or `None` if none is stored.
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        directory = self._get_directory(tradeable)
+        rows = self._count_rows(directory)
+        if rows <= 0: return None
+        with open(os.path.join(directory, 't'), 'rb') as f:
+            f.seek((rows - 1) * 8)
+            return struct.unpack('<d', f.read(8))[0]
+
+    def append(self, tradeable, candles):
+        """
+        Appends candle dictionaries, as returned by the API, to the history of a `Tradeable` or `isin`.
+        Candles not newer than the newest stored one are skipped. Returns how many were appended.
+        """
+        import numpy as np
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        last = self.get_last_timestamp(tradeable)
+        rows = sorted(row for row in map(self._parse_candle, candles) if last is None or row[0] > last)
+        rows = [row for i, row in enumerate(rows) if i == 0 or row[0] != rows[i - 1][0]]
+        if len(rows) <= 0: return 0
+
+        directory = self._get_directory(tradeable)
+        os.makedirs(directory, exist_ok=True)
+        self._truncate(directory, self._count_rows(directory))
+        table = np.asarray(rows, dtype='<f8')
+        for i, column in enumerate(self.COLUMNS):
+            with open(os.path.join(directory, column), 'ab') as f: f.write(np.ascontiguousarray(table[:, i]).tobytes())
+        return len(rows)
+
+    def download(self, tradeables, start:datetime, end:datetime=None, max_workers:int=8, transport:Transport=None):
+        """
+        Downloads the history of many `Tradeables` or `isins` from `start` to `end`, or now, concurrently.
+        Only the part after the newest stored candle of each is requested. \n
+        Returns a tuple of two dictionaries: `isin` to the number of candles appended, and `isin` to the raised exception for every failed download.
+        """
+        transport = transport or Lemon.transport
+        isins = list(OrderedDict.fromkeys(t.isin if isinstance(t, Tradeable) else t for t in tradeables))
+        appended, errors = dict(), dict()
+        if len(isins) <= 0: return appended, errors
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(isins)))) as pool:
+            futures = {isin: _submit(pool, self._download, isin, start, end, transport) for isin in isins}
+            for isin, future in futures.items():
+                try: appended[isin] = future.result()
+                except Exception as e: errors[isin] = e
+        return appended, errors
+
+    def _download(self, isin, start, end, transport):
+        last = self.get_last_timestamp(isin)
+        date_from = start.timestamp() if last is None else max(start.timestamp(), last + self.RESOLUTIONS[self.resolution])
+        date_until = (end or datetime.now().astimezone()).timestamp()
+        if date_from > date_until: return 0
+
+        params = {'date_from': date_from, 'date_until': date_until}
+        appended = 0
+        for page in _iter_pages(transport, 'data/instruments/{0}/candle/{1}/'.format(isin, self.resolution), params=params):
+            appended += self.append(isin, page['results'])
+        return appended
+
+    def _get_directory(self, isin):
+        return os.path.join(self.path, isin)
+
+    def _count_rows(self, directory):
+        # columns are appended one after another, so an interrupted append leaves some longer; only complete rows count
+        try: return min(os.path.getsize(os.path.join(directory, column)) for column in self.COLUMNS) // 8
+        except OSError: return 0
+
+    def _truncate(self, directory, rows):
+        for column in self.COLUMNS:
+            file = os.path.join(directory, column)
+            if os.path.exists(file) and os.path.getsize(file) != rows * 8:
+                with open(file, 'r+b') as f: f.truncate(rows * 8)
+
+    @staticmethod
+    def _parse_candle(candle):
+        t = candle.get('date', candle.get('t'))
+        if isinstance(t, str): t = datetime.fromisoformat(t.replace('Z', '+00:00')).timestamp()
+        return (float(t), float(candle.get('open', candle.get('o'))), float(candle.get('high', candle.get('h'))),
+                float(candle.get('low', candle.get('l'))), float(candle.get('close', candle.get('c'))), float(candle.get('volume', candle.get('v')) or 0))
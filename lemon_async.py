@@ -0,0 +1,498 @@
+import json
+import asyncio
+import aiohttp
+import requests
+from datetime import timedelta, datetime
+from collections import OrderedDict
+from lemon import API_URL, Lemon, Tradeable, Portfolio, CredentialCache, InstrumentCache, _get_closest_string, _normalize_search, _search_catalog, _prepare_order
+
+
+class AsyncResponse:
+    """
+    The fully read response to a request made through an `AsyncTransport`.
+    Mirrors the parts of `requests.Response` used by `lemon`, so both clients handle responses the same way.
+    """
+    def __init__(self, status_code:int, headers, content:bytes, url:str):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        """Raises a `requests.exceptions.HTTPError` for 4xx and 5xx responses, just like `requests` does."""
+        if 400 <= self.status_code < 600:
+            raise requests.exceptions.HTTPError('{0} Error for url: {1}'.format(self.status_code, self.url), response=self)
+
+class AsyncTransport:
+    """
+    A pooled, keep-alive, non-blocking HTTP transport. The asyncio counterpart of `lemon.Transport`. \n
+    `base_url`: the root relative paths are resolved against. Point it at a local server to stub lemon.markets. \n
+    `timeout`: the default total timeout of a request in seconds. Can be overridden per request. \n
+    `retries`: how often idempotent requests are retried on connection errors and 5xx responses. \n
+    `backoff`: the delay in seconds before the first retry. Doubles on every further attempt. \n
+    `limit`: how many connections may be open at once, which bounds how many requests are in flight. \n
+    `keepalive_timeout`: how many seconds an idle connection is kept open for reuse. \n
+    `credentials`: the `CredentialCache` of keys validated over this transport. A fresh one by default. \n
+    The underlying `aiohttp.ClientSession` is created on first use, inside the running event loop.
+    """
+    RETRY_STATUSES = frozenset((500, 502, 503, 504))
+    IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'DELETE'))
+
+    def __init__(self, base_url:str=API_URL, timeout:float=10, retries:int=3, backoff:float=0.25, limit:int=256, keepalive_timeout:float=30, credentials:CredentialCache=None):
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.credentials = credentials or CredentialCache()
+        self._session = None
+        self._loop = None
+
+    def url(self, path:str):
+        """
+        Resolves `path` against this transport's `base_url`. Absolute URLs, such as pagination links, are returned as is.
+        """
+        if path.startswith(('http://', 'https://')): return path
+        return self.base_url + path.lstrip('/')
+
+    async def request(self, method:str, path:str, retries:int=None, timeout:float=None, **kwargs):
+        """
+        Sends a request over the pooled session and returns an `AsyncResponse`. \n
+        `retries`: overrides the retry count of this transport. Requests that are not idempotent, such as creating an order, are never retried. \n
+        Any other keyword arguments are passed on to `aiohttp.ClientSession.request`.
+        """
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        if method not in self.IDEMPOTENT_METHODS: retries = 0
+        timeout = aiohttp.ClientTimeout(total=self.timeout if timeout is None else timeout)
+
+        url = self.url(path)
+        session = self._get_session()
+        for attempt in range(retries + 1):
+            try:
+                async with session.request(method, url, timeout=timeout, **kwargs) as response:
+                    response = AsyncResponse(response.status, response.headers, await response.read(), url)
+            except aiohttp.ClientConnectionError:
+                if attempt >= retries: raise
+            else:
+                if response.status_code in (401, 403) and 'Authorization' in (kwargs.get('headers') or {}):
+                    self.credentials.invalidate(kwargs['headers']['Authorization'])
+                if attempt >= retries or response.status_code not in self.RETRY_STATUSES: return response
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get(self, path:str, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path:str, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    async def delete(self, path:str, **kwargs):
+        return await self.request('DELETE', path, **kwargs)
+
+    async def close(self):
+        """Closes all pooled connections."""
+        if self._session is not None and not self._session.closed: await self._session.close()
+        self._session = self._loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+class AsyncLemon:
+    """
+    The asyncio counterpart of `Lemon`. Market hours are answered by `Lemon` directly, as they need no requests.
+    """
+    transport = AsyncTransport()
+
+    is_market_open = staticmethod(Lemon.is_market_open)
+    next_market_availability = staticmethod(Lemon.next_market_availability)
+    next_market_opening = staticmethod(Lemon.next_market_opening)
+    next_market_closing = staticmethod(Lemon.next_market_closing)
+
+    @staticmethod
+    async def select_account(auth, name='', transport:AsyncTransport=None):
+        """
+        Selects an account beloning to the holder of the authentication provided.
+        If no name is provided, it selects the first accound. Otherwise, it searches available accounts for the closest match.
+        `transport`: the `AsyncTransport` the account should use. `AsyncLemon.transport` by default.
+        """
+        transport = transport or AsyncLemon.transport
+        assert await AsyncLemon.validate_key(auth, transport=transport), 'Endpoint not reachable. Check your credentials and connection.'
+
+        accounts = (await transport.get('accounts/', headers={'Authorization': auth})).json()['results']
+
+        if name:
+            names = [a['name'] for a in accounts]
+            index = names.index(_get_closest_string(name, names))
+            return AsyncAccount(accounts[index]['uuid'], auth, transport=transport)
+        return AsyncAccount(accounts[0]['uuid'], auth, transport=transport)
+
+    @staticmethod
+    async def search_for_tradeable(query, search_for:str='all', search_type:str='all', transport:AsyncTransport=None):
+        """
+        Searches for a `Tradeable` by query. Takes the same arguments as `Lemon.search_for_tradeable`. \n
+        Returns `None` if tradeable is not found.
+        """
+        if len(query) <= 0: return None
+        transport = transport or AsyncLemon.transport
+
+        search_for, search_type = _normalize_search(search_for, search_type)
+
+        # answer from the local catalog where it has a close enough match, otherwise ask the API
+        found = _search_catalog(query, search_for, search_type)
+        if found: return AsyncTradeable(found['isin'], transport=transport, details=found)
+
+        instruments = list()
+
+        next_page = 'data/instruments/?search={0}'.format(query)
+        if search_type != None and 'symbol' in search_type: next_page = 'data/instruments/?search={0}'.format(query[0])
+        while next_page:
+            search = await transport.get(next_page)
+            search.raise_for_status(); search = search.json()
+            if search['count'] >= 1: instruments.extend(search['results'])
+            next_page = search['next']
+
+        if len(instruments) <= 0: return None
+        if search_for: instruments = list(filter(lambda x: x['type'].lower() in search_for, instruments))
+        if not search_type: return await AsyncLemon.get_tradeable(instruments[0]['isin'], transport=transport)
+
+        instr_names = [x[search_type] for x in instruments]
+        try:
+            to_search = _get_closest_string(query, instr_names, length_dependant=False)
+            indx = instr_names.index(to_search)
+            return await AsyncLemon.get_tradeable(instruments[indx]['isin'], transport=transport)
+        except (IndexError, ValueError):
+            return None
+
+    @staticmethod
+    async def get_tradeable(isin:str, transport:AsyncTransport=None):
+        """
+        Returns an `AsyncTradeable` with its details already loaded, so reading them never blocks.
+        The details come from `Lemon.instruments` where possible.
+        """
+        transport = transport or AsyncLemon.transport
+        return AsyncTradeable(isin, transport=transport, details=await AsyncLemon._fetch_details(isin, transport))
+
+    @staticmethod
+    async def _fetch_details(isin, transport):
+        details = Lemon.instruments.peek(isin)
+        if details is None:
+            req = await transport.get('data/instruments/{0}/'.format(isin))
+            req.raise_for_status(); details = req.json()
+            details['name'] = details.pop('title', None)
+        return details
+
+    @staticmethod
+    async def get_tradeable_cost(tradeable, timeout_limit=0.25, transport:AsyncTransport=None):
+        """
+        Returns the last recorded price of a `Tradeable`
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        return await AsyncLemon._fetch_tradeable_cost(tradeable, timeout_limit > 0 and Lemon.is_market_open(), timeout_limit, transport or AsyncLemon.transport)
+
+    @staticmethod
+    async def get_tradeable_costs(tradeables, timeout_limit=0.25, max_concurrency:int=64, transport:AsyncTransport=None):
+        """
+        Returns the last recorded prices of many `Tradeables` or `isins`, fetched concurrently. \n
+        `max_concurrency`: how many lookups may be in flight at once. \n
+        Returns a tuple of two dictionaries: `isin` to price for every successful lookup, and `isin` to the raised exception for every failed one.
+        """
+        transport = transport or AsyncLemon.transport
+        isins = list(OrderedDict.fromkeys(t.isin if isinstance(t, Tradeable) else t for t in tradeables))
+        use_ticks = timeout_limit > 0 and Lemon.is_market_open()
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def fetch(isin):
+            async with semaphore:
+                return await AsyncLemon._fetch_tradeable_cost(isin, use_ticks, timeout_limit, transport)
+
+        results = await asyncio.gather(*(fetch(isin) for isin in isins), return_exceptions=True)
+        prices, errors = dict(), dict()
+        for isin, result in zip(isins, results):
+            if isinstance(result, Exception): errors[isin] = result
+            else: prices[isin] = result
+        return prices, errors
+
+    @staticmethod
+    async def _fetch_tradeable_cost(isin, use_ticks, timeout_limit, transport):
+        if use_ticks:
+            try:
+                ticker = await transport.get('data/instruments/{0}/ticks/latest/'.format(isin), timeout=timeout_limit, retries=0)
+                ticker.raise_for_status(); ticker = ticker.json()
+                if ticker['price'] > 0: return ticker['price']
+            except (asyncio.TimeoutError, KeyError):
+                pass
+        ticker = await transport.get('data/instruments/{0}/candle/m1/latest'.format(isin))
+        ticker.raise_for_status(); ticker = ticker.json()
+        return ticker['close']
+
+    @staticmethod
+    async def validate_key(auth, transport:AsyncTransport=None, use_cache:bool=True):
+        """
+        Checks if the authentication given is valid. Wastes an API call, unless the key was already validated within the `ttl` of the transport's `CredentialCache`.
+        `use_cache`: set to `False` to always ask the API.
+        """
+        transport = transport or AsyncLemon.transport
+        if use_cache and transport.credentials.is_valid(auth): return True
+
+        try:
+            req = await transport.get('accounts/', headers={'Authorization': auth})
+            req.raise_for_status(); req = req.json()
+            if 'results' not in str(req): return False
+            transport.credentials.add(auth)
+            return True
+        except (asyncio.TimeoutError, ValueError): return False
+
+class AsyncTradeable(Tradeable):
+    """
+    The asyncio counterpart of `Tradeable`, as returned by `AsyncLemon.get_tradeable`.
+    Its details are loaded on creation, with `None` for any the API left out, so reading them never makes a blocking request.
+    """
+    def __init__(self, isin, transport:AsyncTransport=None, details:dict=None):
+        super().__init__(isin, details=details)
+        self.transport = transport or AsyncLemon.transport
+        if self._details is None:
+            self._details = dict.fromkeys(InstrumentCache.REQUIRED_FIELDS)
+            self._details.update(details or {}, isin=isin)
+
+    async def get_cost(self):
+        """
+        Returns the last recorded cost for this `AsyncTradeable`.
+        An alias for `AsyncLemon.get_tradeable_cost`.
+        """
+        return await AsyncLemon.get_tradeable_cost(self, transport=self.transport)
+
+    async def get_details(self):
+        """
+        Returns a dictionary containing this `tradeable`'s `isin`, `wkn`, `name`, `type`, and `symbol`.
+        Served from `Lemon.instruments` where possible.
+        """
+        return await AsyncLemon._fetch_details(self.isin, self.transport)
+
+class AsyncHeldTradeable(AsyncTradeable):
+    """
+    The asyncio counterpart of `HeldTradeable`. Details missing from what it was created with are `None`; await `get_details` for all of them.
+    """
+    def __init__(self, isin, account, details:dict=None):
+        if not isinstance(account, AsyncAccount): raise ValueError('Account provided is not a valid account')
+        self.account = account
+        # portfolio payloads name the instrument by its title
+        if details and 'name' not in details and 'title' in details: details = dict(details, name=details['title'])
+        super().__init__(isin, transport=account.transport, details=details)
+
+    async def get_amount(self):
+        """
+        Returns how many of this `Tradeable` you hold.
+        """
+        return await self.account.get_held_count(self.isin)
+
+    async def get_acquired_cost(self):
+        """
+        Returns the average cost of acquiring this `Tradeable`, or `-1` if you do not hold any.
+        """
+        held_tradeable = await self.account.transport.get('accounts/{0}/portfolio/{1}/aggregated/'.format(self.account.uuid, self.isin), headers={'Authorization': self.account.auth})
+        held_tradeable.raise_for_status(); held_tradeable = held_tradeable.json()
+
+        if len(held_tradeable) <= 0: return -1
+        return held_tradeable['average_price']
+
+    async def buy(self, quantity:int=1, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False):
+        """
+        Creates a buy order for this `Tradeable`. Alias for `AsyncAccount.create_buy_order`
+        """
+        return await self.account.create_buy_order(self, quantity=quantity, slippage=slippage, limits=limits, length=length, handle_errors=handle_errors)
+
+    async def sell(self, quantity:int=1, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False):
+        """
+        Creates a sell order for this `Tradeable`. Alias for `AsyncAccount.create_sell_order`
+        """
+        return await self.account.create_sell_order(self, quantity=quantity, slippage=slippage, limits=limits, length=length, handle_errors=handle_errors)
+
+class AsyncAccount:
+    """
+    The asyncio counterpart of `Account`.
+    """
+    def __init__(self, uuid, auth_key, transport:AsyncTransport=None):
+        self.uuid = uuid
+        self.auth = auth_key
+        self.transport = transport or AsyncLemon.transport
+
+    async def get_funds(self):
+        """
+        Gets the available, investible funds of this account.
+        """
+        assert await AsyncLemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
+
+        req = await self.transport.get('accounts/{0}/state/'.format(self.uuid), headers={'Authorization': self.auth})
+        req.raise_for_status(); req = req.json()
+        return req['cash_to_invest']
+
+    async def get_value(self):
+        """
+        Returns the investible funds plus the current value of everything held. Values a single `AsyncPortfolio` snapshot.
+        """
+        return await (await self.get_portfolio()).get_value()
+
+    async def get_portfolio(self):
+        """
+        Returns an `AsyncPortfolio` snapshot of everything held and the investible funds of this account.
+        """
+        assert await AsyncLemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
+
+        held, state = await asyncio.gather(
+            self.transport.get('accounts/{0}/portfolio/aggregated'.format(self.uuid), headers={'Authorization': self.auth}),
+            self.transport.get('accounts/{0}/state/'.format(self.uuid), headers={'Authorization': self.auth}))
+        held.raise_for_status(); held = held.json()
+        state.raise_for_status(); state = state.json()
+        return AsyncPortfolio(self, held, state['cash_to_invest'])
+
+    async def get_held_tradeables(self):
+        """
+        Returns a list of all `AsyncHeldTradeables` currently held, with the details the portfolio listing contains.
+        """
+        assert await AsyncLemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
+
+        held = await self.transport.get('accounts/{0}/portfolio/aggregated'.format(self.uuid), headers={'Authorization': self.auth})
+        held.raise_for_status(); held = held.json()
+        return [AsyncHeldTradeable(x['instrument']['isin'], self, details=x['instrument']) for x in held]
+
+    async def get_held_tradeable(self, tradeable:str or Tradeable):
+        """
+        Returns an `AsyncHeldTradeable` matching the given `isin` or `Tradeable`, with its details loaded.
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        return AsyncHeldTradeable(tradeable, self, details=await AsyncLemon._fetch_details(tradeable, self.transport))
+
+    async def get_held_count(self, tradeable:str or Tradeable):
+        """
+        Returns an integer representing how many of a `Tradeable` or `isin` you hold
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        held_tradeable = await self.transport.get('accounts/{0}/portfolio/{1}/aggregated/'.format(self.uuid, tradeable), headers={'Authorization': self.auth})
+        held_tradeable.raise_for_status(); held_tradeable = held_tradeable.json()
+
+        if len(held_tradeable) <= 0: return 0
+        return held_tradeable['quantity']
+
+    async def get_orders(self, ignore_executed:bool= True):
+        """
+        Returns a list of `AsyncOrders`.
+        If `ignore_executed` is `True`, it returns a list of `AsyncOrders` that have not been executed yet
+        """
+        assert await AsyncLemon.validate_key(self.auth, transport=self.transport), 'Authorization invalid. Check your credentials and connection.'
+
+        orders = list()
+        page = 'accounts/{0}/orders/'.format(self.uuid)
+        while page:
+            response = await self.transport.get(page, headers={'Authorization': self.auth})
+            response.raise_for_status(); response = response.json()
+            page = response['next']
+
+            filtered_orders = filter(lambda x: 'executed' not in str(x['status']).lower() or not ignore_executed, response['results'])
+            orders.extend(list(map(lambda x: AsyncOrder(x['uuid'], self), filtered_orders)))
+        return orders
+
+    async def create_order(self, tradeable:Tradeable or str, quantity:int=1, buy:bool=False, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False):
+        """
+        Creates an order on the stock market. Takes the same arguments as `Account.create_order`. \n
+        The price, and the held quantity or funds it is checked against, are requested concurrently. \n
+        Returns an `AsyncOrder` representing the created order, or `None` if `handle_errors` dropped it.
+        """
+        if isinstance(tradeable, Tradeable): tradeable = tradeable.isin
+        price, available = await asyncio.gather(AsyncLemon.get_tradeable_cost(tradeable, transport=self.transport),
+                                                self.get_funds() if buy else self.get_held_count(tradeable))
+
+        request_args = _prepare_order(tradeable, quantity, buy, price, available, slippage, limits, length, handle_errors)
+        if request_args is None: return None
+        order = await self.transport.post('accounts/{0}/orders/'.format(self.uuid), data=request_args, headers={'Authorization': self.auth})
+        order.raise_for_status(); order = order.json()
+        return AsyncOrder(order['uuid'], self)
+
+    async def create_buy_order(self, tradeable:Tradeable, quantity:int=1, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False):
+        """
+        Creates a buy order on the stock market. Alias for `AsyncAccount.create_order`
+        """
+        return await self.create_order(tradeable, quantity=quantity, buy=True, slippage=slippage, limits=limits, length=length, handle_errors=handle_errors)
+
+    async def create_sell_order(self, tradeable:Tradeable, quantity:int=1, slippage:float=0.01, limits:tuple=(False, False), length=timedelta(hours=16), handle_errors:bool=False):
+        """
+        Creates a sell order on the stock market. Alias for `AsyncAccount.create_order`
+        """
+        return await self.create_order(tradeable, quantity=quantity, buy=False, slippage=slippage, limits=limits, length=length, handle_errors=handle_errors)
+
+class AsyncOrder:
+    """
+    The asyncio counterpart of `Order`.
+    """
+    def __init__(self, uuid, account:AsyncAccount):
+        if not isinstance(account, AsyncAccount): raise ValueError('Account provided is not a valid account')
+        self.uuid = uuid
+        self.account = account
+
+    async def delete(self):
+        """
+        Deletes this order. Returns `True` if successful, `False` otherwise.
+        """
+        assert await AsyncLemon.validate_key(self.account.auth, transport=self.account.transport), 'Authorization invalid. Check your credentials and connection.'
+        deleted = await self.account.transport.delete('accounts/{0}/orders/{1}/'.format(self.account.uuid,self.uuid), headers={'Authorization': self.account.auth})
+        deleted.raise_for_status()
+        return deleted.status_code == 204
+
+    async def get_status(self):
+        """
+        Gets a `tuple` representing the status of the order.
+        The first value is the status as a string, the second is the amount it executed with, or `-1` if still pending.
+        """
+        assert await AsyncLemon.validate_key(self.account.auth, transport=self.account.transport), 'Authorization invalid. Check your credentials and connection.'
+        order = await self.account.transport.get('accounts/{0}/orders/{1}/'.format(self.account.uuid,self.uuid), headers={'Authorization': self.account.auth})
+        order.raise_for_status(); order = order.json()
+
+        if 'open' in order['status']: return (order['status'], -1)
+        return order['status'], order['average_price']
+
+class AsyncPortfolio(Portfolio):
+    """
+    The asyncio counterpart of `Portfolio`. Tradeables and value are loaded with awaitable methods.
+    """
+    def __init__(self, account:AsyncAccount, positions:list, funds:float):
+        if not isinstance(account, AsyncAccount): raise ValueError('Account provided is not a valid account')
+        self.account = account
+        self.funds = funds
+        self.timestamp = datetime.now().astimezone()
+        self.positions = OrderedDict((x['instrument']['isin'], x) for x in positions)
+
+    async def get_tradeables(self):
+        """
+        Returns a list of all `AsyncHeldTradeables` in this snapshot, with the details the snapshot contains. Makes no request.
+        """
+        return [AsyncHeldTradeable(isin, self.account, details=x['instrument']) for isin, x in self.positions.items()]
+
+    async def get_value(self, prices:dict=None):
+        """
+        Returns the investible funds plus the value of every position. \n
+        `prices`: an optional mapping of `isin` to price. Positions missing from it are priced concurrently with `AsyncLemon.get_tradeable_costs`.
+        """
+        prices = dict(prices or dict())
+        missing = [isin for isin in self.positions if isin not in prices]
+        if missing:
+            fetched, errors = await AsyncLemon.get_tradeable_costs(missing, transport=self.account.transport)
+            if errors: raise next(iter(errors.values()))
+            prices.update(fetched)
+        return super().get_value(prices=prices)
+
+    def __iter__(self):
+        return iter(self.positions)